@@ -0,0 +1,25 @@
+import streamlit as st
+import dataset_registry
+
+# --- Page Setup ---
+st.set_page_config(
+    page_title="SARL PRO Tools",
+    page_icon="fav.png",
+    layout="wide"
+)
+
+# One process for every tool: pages share the files loaded in this session
+pages = {
+    "Excel": [
+        st.Page("merger.py", title="Excel Tools", icon="📊", default=True),
+        st.Page("tet.py", title="Excel Matcher", icon="🔍", url_path="matcher"),
+    ],
+    "Dispatch": [
+        st.Page("order_dispatch.py", title="Order Dispatch", icon="🚚", url_path="dispatch"),
+        st.Page("dispatch+vip.py", title="VIP Dispatch", icon="⭐", url_path="vip_dispatch"),
+    ],
+}
+
+page = st.navigation(pages)
+dataset_registry.render_panel()
+page.run()
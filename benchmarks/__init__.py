@@ -0,0 +1,19 @@
+"""Benchmark suite for the Excel tools and dispatch dashboards.
+
+Benchmarks live in the ``bench_*`` modules and register with ``@benchmark``.
+Each one receives the synthetic dataset for the chosen size and returns
+``(func, rows)``: ``func`` is the timed call and ``rows`` how many rows it
+processes. ``budget`` (seconds) turns a benchmark into a check: the run fails
+when its median goes over. Run them with ``python -m benchmarks.run``.
+"""
+BENCHMARKS = {}
+BUDGETS = {}
+
+
+def benchmark(name, budget=None):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        if budget is not None:
+            BUDGETS[name] = budget
+        return setup
+    return register
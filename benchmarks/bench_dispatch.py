@@ -0,0 +1,70 @@
+"""Dispatch allocation strategies (dispatch_core), KPIs (dispatch_report), slips and the backorder ledger."""
+import os
+import tempfile
+
+import dispatch_core
+import dispatch_ledger
+import dispatch_report
+import dispatch_slips
+from benchmarks import benchmark
+from benchmarks.generators import merged_order_book
+
+
+def _order_book(data):
+    return merged_order_book(data["orders"], data["stock"]), data["stock"]
+
+
+@benchmark("dispatch.greedy_vip")
+def greedy_vip(data):
+    merged, stock = _order_book(data)
+    return lambda: dispatch_core.greedy_vip(merged, stock), len(merged)
+
+
+@benchmark("dispatch.proportional")
+def proportional(data):
+    merged, stock = _order_book(data)
+    return lambda: dispatch_core.proportional(merged, stock), len(merged)
+
+
+@benchmark("dispatch.proportional_vip")
+def proportional_vip(data):
+    merged, stock = _order_book(data)
+    return lambda: dispatch_core.proportional_vip(merged, stock, vip_boost=5), len(merged)
+
+
+@benchmark("dispatch.max_min_fair")
+def max_min_fair(data):
+    merged, stock = _order_book(data)
+    return lambda: dispatch_core.max_min_fair(merged, stock, vip_weight=2), len(merged)
+
+
+@benchmark("dispatch.fifo")
+def fifo(data):
+    merged, stock = _order_book(data)
+    return lambda: dispatch_core.fifo(merged, stock, date_column="Order_Date"), len(merged)
+
+
+@benchmark("dispatch.summary")
+def summary(data):
+    merged, stock = _order_book(data)
+    dispatch_core.greedy_vip(merged, stock)
+    merged["To_Give"] = merged["Auto_Dispatch_Qty"]
+    return lambda: dispatch_report.summarize(merged, client_keys=("Client", "VIP"), vip_bonus=10), len(merged)
+
+
+@benchmark("dispatch.slips_xlsx")
+def slips_xlsx(data):
+    merged, stock = _order_book(data)
+    dispatch_core.greedy_vip(merged, stock)
+    merged["To_Give"] = merged["Auto_Dispatch_Qty"]
+    return lambda: dispatch_slips.slips_zip(merged, "xlsx").close(), len(merged)
+
+
+@benchmark("dispatch.ledger_plan")
+def ledger_plan(data):
+    # Yesterday's run recorded 90% of the lines: today's plan re-reads the whole history
+    orders, stock = data["orders"], data["stock"]
+    ledger = dispatch_ledger.DispatchLedger(os.path.join(tempfile.mkdtemp(), "ledger.sqlite"))
+    plan = ledger.plan(orders.iloc[:len(orders) * 9 // 10], stock, cumulative=True, day="2025-01-01")
+    ledger.commit(plan, dispatch_core.fifo(plan.book.copy(), plan.stock)["Auto_Dispatch_Qty"])
+    return lambda: ledger.plan(orders, stock.assign(Available_Qty=10), cumulative=True, day="2025-01-02"), len(orders)
@@ -0,0 +1,72 @@
+"""Excel import and export of an order book, and reader engines compared."""
+import importlib.util
+import os
+import tempfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import drop_folder
+import excel_io
+from benchmarks import benchmark
+from benchmarks.generators import to_xlsx
+
+
+@benchmark("excel.read")
+def read(data):
+    payload = to_xlsx(data["orders"])
+    return lambda: pd.read_excel(BytesIO(payload)), len(data["orders"])
+
+
+# One benchmark per engine and workbook shape: numeric order lines, a text-heavy
+# catalogue and the long source/quantity table of the match & merge tab
+ENGINE_SHAPES = {"orders": "orders", "catalogue": "catalogue", "sources": "source_quantities"}
+ENGINE_MODULES = {"openpyxl": "openpyxl", "calamine": "python_calamine"}
+
+
+def _engine_read(shape, engine):
+    def setup(data):
+        if importlib.util.find_spec(ENGINE_MODULES[engine]) is None:
+            return None
+        frame = data[ENGINE_SHAPES[shape]]
+        payload = to_xlsx(frame)
+        return lambda: pd.read_excel(BytesIO(payload), engine=engine), len(frame)
+    return setup
+
+
+for _shape in ENGINE_SHAPES:
+    for _engine in ENGINE_MODULES:
+        benchmark(f"excel.read.{_shape}.{_engine}")(_engine_read(_shape, _engine))
+
+
+@benchmark("excel.write")
+def write(data):
+    return lambda: to_xlsx(data["orders"]), len(data["orders"])
+
+
+def _split_files(orders_df):
+    bounds = np.linspace(0, len(orders_df), 9, dtype=int)
+    return [(f"part{n}.xlsx", to_xlsx(orders_df.iloc[start:end])) for n, (start, end) in enumerate(zip(bounds, bounds[1:]))]
+
+
+@benchmark("excel.read_many")
+def read_many(data):
+    # Eight workbooks, parsed side by side by the worker processes (merger tabs 1, 3 and 4)
+    files = _split_files(data["orders"])
+    return lambda: list(excel_io.read_many(files)), len(data["orders"])
+
+
+@benchmark("excel.drop_folder.load")
+def drop_folder_load(data):
+    # The same eight workbooks synced once into the drop folder dataset, then loaded back
+    if not drop_folder.available():
+        return None
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "drop"))
+    for name, payload in _split_files(data["orders"]):
+        with open(os.path.join(root, "drop", name), "wb") as f:
+            f.write(payload)
+    drop = drop_folder.DropFolder(os.path.join(root, "drop"), store_dir=os.path.join(root, "store"), root=os.path.realpath(root))
+    drop.sync()
+    return lambda: (drop.sync(), drop.load()), len(data["orders"])
@@ -0,0 +1,42 @@
+"""Match & Merge matrix mode (merger.py tab 2), in pandas and DuckDB."""
+import merge_ops
+import sql_backend
+from benchmarks import benchmark
+
+
+def _frames(data):
+    refs = data["catalogue"][["Référence", "Désignation"]]
+    return refs, data["source_quantities"]
+
+
+@benchmark("match_merge.pandas")
+def pandas_matrix(data):
+    df1, df2 = _frames(data)
+
+    def run():
+        matrix = merge_ops.reference_matrix(df2, "Référence", "Source", "Quantité")
+        return merge_ops.fill_matrix(df1, "Référence", matrix)
+
+    return run, len(df1) + len(df2)
+
+
+@benchmark("match_merge.duckdb")
+def duckdb_matrix(data):
+    if not sql_backend.available():
+        return None
+    df1, df2 = _frames(data)
+
+    def run():
+        backend = sql_backend.DuckDBBackend()
+        try:
+            backend.register("left_df", df1)
+            backend.register("right_df", df2)
+            codes = {code: merge_ops.code_label(code) for code in backend.source_codes("right_df", "Source")}
+            sql, params = backend.reference_matrix_sql(
+                "left_df", "Référence", "right_df", "Référence", "Source", "Quantité", codes
+            )
+            return sum(len(page) for page in backend.pages(sql, params))
+        finally:
+            backend.close()
+
+    return run, len(df1) + len(df2)
@@ -0,0 +1,44 @@
+"""Excel Matcher pipeline (tet.py) from search terms to ordered matches."""
+from matching import ExactMatcher, FuzzyMatcher, MatchAccumulator, dedup_term_rows, sorted_order
+from ref_index import TrigramIndex
+from benchmarks import benchmark
+
+
+def _run_matcher(matcher, unique_rows, categories, fuzzy):
+    results = MatchAccumulator()
+    for n, term_set in enumerate(unique_rows):
+        positions, scores = matcher.match(term_set)
+        results.add(n, positions, scores)
+    tuple_idx, _, scores = results.arrays()
+    return sorted_order(unique_rows, categories, tuple_idx, scores if fuzzy else None)
+
+
+def _inputs(data):
+    database_df = data["catalogue"].astype(str)
+    search_terms = {"Reference": data["search_terms"]["Reference"].fillna('').astype(str).tolist()}
+    categories = [list(dict.fromkeys(terms)) for terms in search_terms.values()]
+    return database_df, search_terms, categories
+
+
+@benchmark("matcher.exact")
+def exact(data):
+    database_df, search_terms, categories = _inputs(data)
+
+    def run():
+        unique_rows, _ = dedup_term_rows(search_terms)
+        matcher = ExactMatcher(database_df, ["Référence"])
+        return _run_matcher(matcher, unique_rows, categories, fuzzy=False)
+
+    return run, len(search_terms["Reference"])
+
+
+@benchmark("matcher.fuzzy")
+def fuzzy(data):
+    database_df, search_terms, categories = _inputs(data)
+
+    def run():
+        unique_rows, _ = dedup_term_rows(search_terms)
+        index = TrigramIndex(database_df[["Référence"]].itertuples(index=False))
+        return _run_matcher(FuzzyMatcher(index, 0.8), unique_rows, categories, fuzzy=True)
+
+    return run, len(search_terms["Reference"])
@@ -0,0 +1,52 @@
+"""Cold start of each app: a fresh interpreter renders the page before any upload.
+
+Plotting, PDF and DuckDB modules must not be imported until a section needs
+them, and each app's whole cold start (interpreter, Streamlit and the script's
+own imports) must fit in ``STARTUP_BUDGET`` seconds.
+"""
+import os
+import subprocess
+import sys
+
+from benchmarks import benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_MODULES = ["matplotlib", "seaborn", "duckdb"]
+STARTUP_BUDGET = 4.0
+APPS = [
+    "app.py", "merger.py", "tet.py", "order_dispatch.py", "new.py", "dispatch+vip.py", "dispatch+vip stable.py",
+    "new copy.py", "new copy 2 with pie.py",
+]
+
+_PROBE = """
+import sys
+from streamlit.testing.v1 import AppTest
+
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+at.run()
+if at.exception:
+    sys.exit(f"{sys.argv[1]} raised: {at.exception[0].value}")
+loaded = [name for name in sys.argv[2:] if name in sys.modules]
+if loaded:
+    sys.exit(f"{sys.argv[1]} imports {', '.join(loaded)} before any upload")
+"""
+
+
+def _cold_start(script):
+    def run():
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE, os.path.join(ROOT, script), *DEFERRED_MODULES],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    return run
+
+
+def _register(script):
+    name = "startup." + os.path.splitext(script)[0].replace(" ", "_").replace("+", "_")
+    benchmark(name, budget=STARTUP_BUDGET)(lambda data: (_cold_start(script), 0))
+
+
+for _script in APPS:
+    _register(_script)
@@ -0,0 +1,175 @@
+"""Synthetic data for the benchmarks, shaped like the real workbooks.
+
+Every generator is seeded, so a given size and seed always produces the same
+frames. Dispatch data uses the column names the dashboards rename to
+(``Product``, ``Client``, ``Ordered_Qty``, ``VIP``, ``Available_Qty``).
+
+Run ``python -m benchmarks.generators --size medium --out bench_data`` to write
+the files as .xlsx and try them in the apps.
+"""
+import argparse
+import os
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+
+def zipf_weights(n, skew):
+    """Popularity of ``n`` items where rank ``r`` weighs ``r ** -skew`` (0 = uniform)."""
+    weights = np.arange(1, n + 1, dtype=float) ** -skew
+    return weights / weights.sum()
+
+
+def product_codes(n, prefix="FIS"):
+    return [f"{prefix}-{code:06d}" for code in range(100000, 100000 + n)]
+
+
+def orders(lines, products=500, clients=200, product_skew=1.1, client_skew=0.8,
+           vip_ratio=0.1, max_qty=50, days=90, seed=0):
+    """Order lines with Zipf-distributed product and client popularity.
+
+    A ``vip_ratio`` share of clients is flagged VIP on all their lines.
+    ``Order_Date`` spreads the lines over ``days`` days.
+    """
+    rng = np.random.default_rng(seed)
+    product_names = np.array(product_codes(products))
+    client_names = np.array([f"Client {n:05d}" for n in range(1, clients + 1)])
+    vip_clients = rng.random(clients) < vip_ratio
+
+    product_idx = rng.choice(products, size=lines, p=zipf_weights(products, product_skew))
+    client_idx = rng.choice(clients, size=lines, p=zipf_weights(clients, client_skew))
+    dates = pd.Timestamp("2025-01-01") + pd.to_timedelta(np.sort(rng.integers(0, days, size=lines)), unit="D")
+
+    return pd.DataFrame({
+        "Product": product_names[product_idx],
+        "Client": client_names[client_idx],
+        "Ordered_Qty": rng.integers(1, max_qty + 1, size=lines),
+        "VIP": vip_clients[client_idx].astype(int),
+        "Order_Date": dates,
+    })
+
+
+def stock(orders_df, coverage=0.7, missing_ratio=0.05, seed=0):
+    """Stock per ordered product at about ``coverage`` of its total demand.
+
+    A ``missing_ratio`` share of the ordered products has no stock row at all.
+    """
+    rng = np.random.default_rng(seed + 1)
+    demand = orders_df.groupby("Product")["Ordered_Qty"].sum()
+    demand = demand[rng.random(len(demand)) >= missing_ratio]
+    available = np.floor(demand.to_numpy() * coverage * rng.uniform(0.5, 1.5, size=len(demand)))
+    return pd.DataFrame({"Product": demand.index, "Available_Qty": available.astype(int)})
+
+
+def merged_order_book(orders_df, stock_df):
+    """Orders joined with stock the way the dispatch dashboards do it."""
+    merged = orders_df.merge(stock_df, on="Product", how="left")
+    merged["Available_Qty"] = merged["Available_Qty"].fillna(0)
+    return merged
+
+
+def catalogue(rows, brands=40, seed=0):
+    """Reference catalogue for the Excel Matcher (text columns, unique references)."""
+    rng = np.random.default_rng(seed + 2)
+    letters = np.array(list("ABCDEFGHJKLMNPRSTUVWXYZ"))
+    prefixes = letters[rng.integers(0, len(letters), size=(rows, 2))]
+    numbers = rng.choice(10_000_000, size=rows, replace=False)
+    refs = [f"{a}{b}-{num:07d}" for (a, b), num in zip(prefixes, numbers)]
+    return pd.DataFrame({
+        "Référence": refs,
+        "Désignation": [f"Article {n}" for n in range(rows)],
+        "Marque": [f"Brand {b}" for b in rng.integers(0, brands, size=rows)],
+        "Prix Gros": rng.integers(100, 10_000, size=rows),
+    })
+
+
+def search_terms(catalogue_df, rows, hit_ratio=0.8, duplicate_ratio=0.3, partial_ratio=0.2,
+                 noisy_ratio=0.0, seed=0):
+    """Search list drawn from ``catalogue_df`` references.
+
+    ``hit_ratio`` of the terms exist in the catalogue, ``partial_ratio`` of those
+    are shortened to a prefix (substring hits on several rows), ``noisy_ratio``
+    are lowercased with the dash removed (only the fuzzy mode finds those), and
+    ``duplicate_ratio`` of all rows repeat an earlier row.
+    """
+    rng = np.random.default_rng(seed + 3)
+    refs = catalogue_df["Référence"].to_numpy()
+    distinct = max(int(rows * (1 - duplicate_ratio)), 1)
+
+    terms = []
+    for n in range(distinct):
+        if rng.random() >= hit_ratio:
+            terms.append(f"ZZ-{rng.integers(0, 10_000_000):07d}")
+            continue
+        term = refs[rng.integers(0, len(refs))]
+        if rng.random() < partial_ratio:
+            term = term[:6]
+        elif rng.random() < noisy_ratio:
+            term = term.replace("-", "").lower()
+        terms.append(term)
+
+    picks = np.concatenate([np.arange(distinct), rng.integers(0, distinct, size=rows - distinct)])
+    rng.shuffle(picks)
+    return pd.DataFrame({"Reference": np.array(terms, dtype=object)[picks]})
+
+
+def source_quantities(refs, rows, sources=20, seed=0):
+    """(reference, source code, quantity) rows for the Match & Merge tab."""
+    rng = np.random.default_rng(seed + 4)
+    codes = np.sort(rng.choice(np.arange(100, 1000), size=sources, replace=False))
+    refs = np.asarray(refs)
+    return pd.DataFrame({
+        "Référence": refs[rng.integers(0, len(refs), size=rows)],
+        "Source": codes[rng.integers(0, sources, size=rows)],
+        "Quantité": rng.integers(0, 500, size=rows),
+    })
+
+
+def to_xlsx(df, sheet_name="Sheet1"):
+    """``df`` as xlsx bytes, as a user upload would arrive."""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+
+SIZES = {
+    "small": {"order_lines": 5_000, "products": 500, "clients": 200, "catalogue": 5_000, "search_terms": 1_000},
+    "medium": {"order_lines": 100_000, "products": 5_000, "clients": 2_000, "catalogue": 100_000, "search_terms": 10_000},
+    "large": {"order_lines": 1_000_000, "products": 20_000, "clients": 5_000, "catalogue": 500_000, "search_terms": 50_000},
+}
+
+
+def dataset(size="small", seed=0, **overrides):
+    """All benchmark frames for a preset ``size`` (see ``SIZES``)."""
+    params = {**SIZES[size], **overrides}
+    orders_df = orders(params["order_lines"], params["products"], params["clients"], seed=seed)
+    stock_df = stock(orders_df, seed=seed)
+    catalogue_df = catalogue(params["catalogue"], seed=seed)
+    return {
+        "orders": orders_df,
+        "stock": stock_df,
+        "catalogue": catalogue_df,
+        "search_terms": search_terms(catalogue_df, params["search_terms"], seed=seed),
+        "source_quantities": source_quantities(catalogue_df["Référence"], params["catalogue"], seed=seed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic benchmark workbooks.")
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_data")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, df in dataset(args.size, args.seed).items():
+        path = os.path.join(args.out, f"{name}.xlsx")
+        with open(path, "wb") as f:
+            f.write(to_xlsx(df))
+        print(f"{path}: {len(df):,} rows")
+
+
+if __name__ == "__main__":
+    main()
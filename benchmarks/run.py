@@ -0,0 +1,159 @@
+"""Run the benchmarks and track them against earlier runs.
+
+    python -m benchmarks.run                      # every benchmark, small size
+    python -m benchmarks.run --size medium -k dispatch
+    python -m benchmarks.run --no-save            # don't append to the results file
+    python -m benchmarks.run -k startup           # cold-start / import-time budgets
+
+Each run appends one JSON line per benchmark to ``benchmarks/results.jsonl``
+(ignored by git: timings only compare on the same machine). A benchmark is
+reported as a regression when its median is more than ``--tolerance`` slower
+than the best median of the last five runs of the same size on this host.
+Benchmarks with a budget (see ``bench_startup``) fail the run when over it.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks import BENCHMARKS, BUDGETS
+from benchmarks.generators import SIZES, dataset
+
+MODULES = ["bench_dispatch", "bench_match_merge", "bench_matcher", "bench_excel", "bench_startup"]
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+HISTORY = 5
+
+
+def load_benchmarks():
+    for module in MODULES:
+        importlib.import_module(f"benchmarks.{module}")
+    return BENCHMARKS
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(RESULTS_PATH)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def host():
+    return f"{platform.node()}/{platform.machine()}/{os.cpu_count()}cpu/py{platform.python_version()}"
+
+
+def measure(func, rounds, warmup=1):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def load_history(path=RESULTS_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(history, name, size, machine):
+    medians = [
+        r["median"] for r in history
+        if r["name"] == name and r["size"] == size and r["host"] == machine
+    ]
+    return min(medians[-HISTORY:]) if medians else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument("-k", dest="pattern", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    selected = {name: setup for name, setup in load_benchmarks().items() if args.pattern in name}
+    if not selected:
+        print(f"No benchmark matches {args.pattern!r}.")
+        return 1
+
+    print(f"Generating {args.size} dataset...")
+    data = dataset(args.size, seed=args.seed)
+    history = load_history()
+    machine = host()
+    commit = git_commit()
+    stamp = datetime.now().isoformat(timespec="seconds")
+
+    records = []
+    regressions = []
+    failures = []
+    print(f"{'benchmark':<34}{'rows':>12}{'median s':>12}{'min s':>10}{'rows/s':>14}  vs best")
+    for name, setup in selected.items():
+        prepared = setup(data)
+        if prepared is None:
+            print(f"{name:<34}{'skipped (dependency not installed)':>48}")
+            continue
+        func, rows = prepared
+        try:
+            timings = measure(func, args.rounds)
+        except Exception as e:
+            print(f"{name:<34}  FAILED: {e}")
+            failures.append(name)
+            continue
+        median = statistics.median(timings)
+        record = {
+            "name": name, "size": args.size, "rows": rows, "rounds": args.rounds,
+            "min": round(min(timings), 5), "median": round(median, 5),
+            "stdev": round(statistics.stdev(timings), 5) if len(timings) > 1 else 0.0,
+            "commit": commit, "host": machine, "timestamp": stamp,
+        }
+        records.append(record)
+
+        best = baseline(history, name, args.size, machine)
+        change = ""
+        if best:
+            ratio = median / best - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.tolerance:
+                change += "  REGRESSION"
+                regressions.append(name)
+        budget = BUDGETS.get(name)
+        if budget is not None and median > budget:
+            change += f"  OVER BUDGET ({budget:g} s)"
+            failures.append(name)
+        rate = rows / median if median else float("inf")
+        print(f"{name:<34}{rows:>12,}{median:>12.4f}{min(timings):>10.4f}{rate:>14,.0f}  {change}")
+
+    if records and not args.no_save:
+        with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        print(f"Results appended to {RESULTS_PATH}")
+
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+    if failures:
+        print(f"Failed: {', '.join(failures)}")
+        return 1
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
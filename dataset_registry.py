@@ -0,0 +1,183 @@
+"""Dataset registry shared by the pages of the multipage app (app.py).
+
+Uploaded workbooks are parsed once per session. Files are keyed by a hash of
+their bytes and read options, so the same file uploaded again (on another
+page, or after a rerun) reuses the parsed frame, and pages can pick a dataset
+another page already loaded instead of uploading it again. Pages receive
+shallow copies: with pandas' copy-on-write, always on from pandas 3 (pinned in
+requirements.txt), their edits never reach the registered frame. The registry
+accounts the memory of what it holds and drops the least recently used
+datasets beyond ``MAX_MEMORY_MB``. Multi-file uploads are parsed concurrently
+by ``excel_io.read_many``.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+import excel_io
+
+MAX_MEMORY_MB = float(os.environ.get("APP_DATASET_MEMORY_MB", 1024))
+_SESSION_KEY = "dataset_registry"
+
+
+class Dataset:
+    def __init__(self, key, name, frame, read_seconds=0.0):
+        self.key = key
+        self.name = name
+        self.frame = frame
+        self.nbytes = int(frame.memory_usage(index=True, deep=True).sum())
+        self.read_seconds = read_seconds
+
+    @property
+    def label(self):
+        return f"{self.name} ({len(self.frame):,} rows, {self.nbytes / 2**20:.1f} MB)"
+
+
+class DatasetRegistry:
+    def __init__(self, max_bytes=MAX_MEMORY_MB * 2**20):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        """Datasets from the least to the most recently used."""
+        return iter(list(self._items.values()))
+
+    def __contains__(self, key):
+        return key in self._items
+
+    @property
+    def total_bytes(self):
+        return sum(item.nbytes for item in self._items.values())
+
+    def get(self, key):
+        self._items.move_to_end(key)
+        return self._items[key].frame.copy(deep=False)
+
+    @staticmethod
+    def key(uploaded_file, read_kwargs):
+        digest = hashlib.sha1(uploaded_file.getvalue())
+        digest.update(repr(sorted(read_kwargs.items())).encode("utf-8"))
+        return digest.hexdigest()
+
+    def load(self, uploaded_file, reader=excel_io.read_excel, **read_kwargs):
+        """Parse ``uploaded_file`` with ``reader`` unless the same bytes were already read."""
+        key = self.key(uploaded_file, read_kwargs)
+        if key not in self._items:
+            start = time.perf_counter()
+            uploaded_file.seek(0)
+            frame = reader(uploaded_file, **read_kwargs)
+            self.add(Dataset(key, uploaded_file.name, frame, time.perf_counter() - start))
+        return self.get(key)
+
+    def load_many(self, uploaded_files, progress=None, **read_kwargs):
+        """Parse the files not read yet concurrently; ``(name, frame, error)`` per file, in order."""
+        keys = [self.key(f, read_kwargs) for f in uploaded_files]
+        frames = {key: self.get(key) for key in keys if key in self._items}
+        errors = {}
+        missing = {key: f for key, f in zip(keys, uploaded_files) if key not in frames}
+        start = time.perf_counter()
+        results = excel_io.read_many(
+            [(f.name, f.getvalue()) for f in missing.values()], progress=progress, **read_kwargs
+        )
+        for key, (name, frame, error) in zip(missing, results):
+            if error is not None:
+                errors[key] = error
+                continue
+            # Wall time since the batch started: files are parsed side by side
+            self.add(Dataset(key, name, frame, time.perf_counter() - start))
+            # Keep our own reference: a large batch may evict its first files from the registry
+            frames[key] = frame
+        return [
+            (f.name, frames[key].copy(deep=False) if key in frames else None, errors.get(key))
+            for key, f in zip(keys, uploaded_files)
+        ]
+
+    def add(self, dataset):
+        self._items[dataset.key] = dataset
+        self._items.move_to_end(dataset.key)
+        # Keep at least the newest dataset even if it alone is over the limit
+        while self.total_bytes > self.max_bytes and len(self._items) > 1:
+            self._items.popitem(last=False)
+
+    def remove(self, key):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+
+def registry():
+    """This session's registry (created on first use)."""
+    if _SESSION_KEY not in st.session_state:
+        st.session_state[_SESSION_KEY] = DatasetRegistry()
+    return st.session_state[_SESSION_KEY]
+
+
+def read_excel(uploaded_file, **read_kwargs):
+    """``excel_io.read_excel`` through the registry: each uploaded file is parsed once."""
+    return registry().load(uploaded_file, **read_kwargs)
+
+
+def read_many(uploaded_files, progress=None, **read_kwargs):
+    """``read_excel`` for a multi-file upload: ``(name, frame, error)`` per file, in upload order."""
+    return registry().load_many(uploaded_files, progress=progress, **read_kwargs)
+
+
+def file_key(uploaded_file, **read_kwargs):
+    """Registry key of ``uploaded_file``: identifies its content (and read options)."""
+    return DatasetRegistry.key(uploaded_file, read_kwargs)
+
+
+def pick_key(label, key, types=("xlsx",), container=st):
+    """Like ``pick`` but returns the registry key of the chosen dataset (or ``None``)."""
+    uploaded_file = container.file_uploader(label, type=list(types), key=f"{key}_upload")
+    if uploaded_file is not None:
+        try:
+            read_excel(uploaded_file)
+            return file_key(uploaded_file)
+        except Exception as e:
+            container.error(f"❌ Failed to read {uploaded_file.name}: {e}")
+            return None
+
+    loaded = {dataset.key: dataset.label for dataset in reversed(list(registry()))}
+    if not loaded:
+        return None
+    choice = container.selectbox(
+        "…or reuse a loaded file",
+        [None] + list(loaded),
+        format_func=lambda k: "—" if k is None else loaded[k],
+        key=f"{key}_dataset"
+    )
+    return choice if choice in registry() else None
+
+
+def pick(label, key, types=("xlsx",), container=st):
+    """File uploader that can also reuse a dataset loaded by another page.
+
+    Returns the DataFrame, or ``None`` while nothing is selected or when the
+    upload cannot be read (the error is shown).
+    """
+    dataset_key = pick_key(label, key, types, container)
+    return None if dataset_key is None else registry().get(dataset_key)
+
+
+def render_panel():
+    """Sidebar summary of the loaded datasets with their memory footprint."""
+    datasets = registry()
+    with st.sidebar.expander(f"🗂️ Loaded files ({len(datasets)})"):
+        st.caption(f"{datasets.total_bytes / 2**20:.1f} MB of {datasets.max_bytes / 2**20:.0f} MB")
+        for dataset in reversed(list(datasets)):
+            col1, col2 = st.columns([4, 1])
+            col1.write(dataset.label)
+            if col2.button("✖", key=f"drop_{dataset.key}", help="Remove from memory"):
+                datasets.remove(dataset.key)
+                st.rerun()
+        if len(datasets) and st.button("Clear all", key="drop_all_datasets"):
+            datasets.clear()
+            st.rerun()
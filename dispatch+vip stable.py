@@ -1,10 +1,10 @@
 import streamlit as st
-from streamlit_option_menu import option_menu
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
-from matplotlib.backends.backend_pdf import PdfPages
+import dataset_registry
+import dispatch_report
+import dispatch_view
+import perf
 
 # ✅ Must be the first Streamlit command
 st.set_page_config(
@@ -16,32 +16,24 @@ st.set_page_config(
 # Show logo and title
 st.image("prg.png", width=250)
 st.title("📦 Client Dispatch and Satisfaction Dashboard")
+prof = perf.start_run("dispatch_vip_stable")
 
 # Sidebar: File uploads
 st.sidebar.header("📁 Upload Files")
 orders_file = st.sidebar.file_uploader("Upload Orders File", type=["xlsx"])
 stock_file = st.sidebar.file_uploader("Upload Stock File", type=["xlsx"])
 
-def dispatch_allocation(df, stock_df):
-    df["Auto_Dispatch_Qty"] = 0
-    for product, group in df.groupby("Product"):
-        total_stock = stock_df.loc[stock_df["Product"] == product, "Available_Qty"].sum()
-
-        for priority in [1, 0]:  # VIP first
-            sub = group[group["VIP"] == priority]
-            for i in sub.index:
-                if total_stock <= 0:
-                    break
-                requested = df.at[i, "Ordered_Qty"]
-                allocated = min(requested, total_stock)
-                df.at[i, "Auto_Dispatch_Qty"] = allocated
-                total_stock -= allocated
-
+def dispatch_allocation(version, df, stock_df):
+    dispatch_view.allocate(version, df, stock_df)
     df["To_Give"] = df["Auto_Dispatch_Qty"]
     return df
 
-def generate_charts(satisfaction_by_client, total_ordered, total_given):
-    fig, ax = plt.subplots(figsize=(10, 5))
+def generate_charts(satisfaction_by_client, fulfillment):
+    # Plotting libraries are only loaded once there is something to plot
+    import seaborn as sns
+
+    fig = dispatch_report.figure(figsize=(10, 5))
+    ax = fig.subplots()
     sns.barplot(data=satisfaction_by_client, x="Client", y="Satisfaction (%)", palette="viridis", ax=ax)
     ax.set_ylim(0, 110)
     ax.set_title("Client Satisfaction (%)")
@@ -49,10 +41,11 @@ def generate_charts(satisfaction_by_client, total_ordered, total_given):
     ax.set_ylabel("Satisfaction (%)")
     for bar in ax.patches:
         ax.annotate(f'{bar.get_height():.1f}%', (bar.get_x() + bar.get_width() / 2, bar.get_height() + 1), ha='center')
-    plt.xticks(rotation=45)
+    ax.tick_params(axis="x", labelrotation=45)
 
-    fig2, ax2 = plt.subplots()
-    ax2.pie([total_given, total_ordered - total_given],
+    fig2 = dispatch_report.figure()
+    ax2 = fig2.subplots()
+    ax2.pie(fulfillment,
             labels=["Fulfilled", "Unfulfilled"],
             colors=["#2ecc71", "#e74c3c"],
             autopct="%1.1f%%",
@@ -65,8 +58,10 @@ def generate_charts(satisfaction_by_client, total_ordered, total_given):
 if orders_file and stock_file:
     try:
         # Load files
-        orders_df = pd.read_excel(orders_file)
-        stock_df = pd.read_excel(stock_file)
+        with prof.span("read files") as span:
+            orders_df = dataset_registry.read_excel(orders_file)
+            stock_df = dataset_registry.read_excel(stock_file)
+            span["rows"] = len(orders_df) + len(stock_df)
 
         # Sidebar column mapping
         st.sidebar.subheader("🔧 Column Mapping")
@@ -81,6 +76,12 @@ if orders_file and stock_file:
         stock_product_col = st.sidebar.selectbox("Product Column (Stock)", stock_cols)
         stock_qty_col = st.sidebar.selectbox("Stock Quantity Column", stock_cols)
 
+        # Same allocation and parameters, files and mapping: same dispatch (cache key for the allocation, client index and KPIs)
+        version = (
+            "greedy_vip", dataset_registry.file_key(orders_file), dataset_registry.file_key(stock_file),
+            product_col, client_col, qty_ordered_col, vip_col, stock_product_col, stock_qty_col, ()
+        )
+
         # Rename columns
         orders_df = orders_df.rename(columns={
             product_col: "Product",
@@ -102,13 +103,17 @@ if orders_file and stock_file:
         stock_df["Available_Qty"] = pd.to_numeric(stock_df["Available_Qty"], errors="coerce").fillna(0)
 
         # Merge and dispatch
-        merged_df = orders_df.merge(stock_df, on="Product", how="left")
-        merged_df = dispatch_allocation(merged_df, stock_df)
+        with prof.span("merge") as span:
+            merged_df = orders_df.merge(stock_df, on="Product", how="left")
+            span["rows"] = len(merged_df)
+        with prof.span("allocation", rows=len(merged_df)):
+            merged_df = dispatch_allocation(version, merged_df, stock_df)
 
         # Client Quantity Adjustment
         st.subheader("✍️ Adjust Quantities for a Client")
-        selected_client = st.selectbox("Choose Client", merged_df["Client"].unique())
-        client_data = merged_df[merged_df["Client"] == selected_client].copy()
+        clients = dispatch_view.client_index(version, merged_df)
+        selected_client = dispatch_view.pick_client(clients)
+        client_data = clients.rows(merged_df, selected_client).copy()
         st.markdown("### You can adjust 'To_Give'. Cannot exceed ordered quantity.")
 
         editor = st.data_editor(
@@ -122,52 +127,47 @@ if orders_file and stock_file:
             max_allowed = merged_df.loc[idx, "Ordered_Qty"]
             merged_df.loc[idx, "To_Give"] = min(row["To_Give"], max_allowed)
 
-        # Satisfaction and Summary
-        merged_df["Satisfaction (%)"] = round((merged_df["To_Give"] / merged_df["Ordered_Qty"]) * 100, 2).fillna(0)
+        # Satisfaction and Summary (KPIs computed once per dispatch and set of edits)
+        edits = (selected_client, tuple(clients.rows(merged_df, selected_client)["To_Give"]))
+        with prof.span("summary", rows=len(merged_df)):
+            summary = dispatch_view.summary(version, edits, merged_df)
+        merged_df["Satisfaction (%)"] = summary.satisfaction
 
         st.subheader("📋 Dispatch Summary")
         st.dataframe(merged_df)
 
         # Charts
         st.subheader("📊 Client Satisfaction Overview")
-        satisfaction_by_client = merged_df.groupby("Client")["Satisfaction (%)"].mean().reset_index()
-        total_ordered = merged_df["Ordered_Qty"].sum()
-        total_given = merged_df["To_Give"].sum()
-        fig, fig2 = generate_charts(satisfaction_by_client, total_ordered, total_given)
-        st.pyplot(fig)
+        with prof.span("charts", rows=len(summary.clients)):
+            fig, fig2 = generate_charts(summary.clients, summary.fulfillment)
+            st.pyplot(fig)
 
-        st.subheader("🥧 Overall Fulfillment")
-        st.pyplot(fig2)
+            st.subheader("🥧 Overall Fulfillment")
+            st.pyplot(fig2)
 
         # Audit Table
         st.subheader("🧮 Stock vs Demand Audit")
-        audit = merged_df.groupby("Product").agg({
-            "Ordered_Qty": "sum",
-            "To_Give": "sum",
-            "Available_Qty": "first"
-        }).reset_index()
-        audit["Remaining_Stock"] = audit["Available_Qty"] - audit["To_Give"]
-        audit["Unmet_Demand"] = audit["Ordered_Qty"] - audit["To_Give"]
-        st.dataframe(audit)
+        st.dataframe(summary.products)
 
         # Download Excel
-        excel_output = BytesIO()
-        with pd.ExcelWriter(excel_output, engine="xlsxwriter") as writer:
-            merged_df.to_excel(writer, sheet_name="Dispatch", index=False)
-            audit.to_excel(writer, sheet_name="Audit", index=False)
+        with prof.span("excel export", rows=len(merged_df)):
+            excel_output = dispatch_report.to_excel(merged_df, summary)
 
         st.download_button(
             label="📥 Download All Tables (Excel)",
-            data=excel_output.getvalue(),
+            data=excel_output,
             file_name="All_Tables_Dispatch_Audit.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
         # Download Charts PDF
-        pdf_output = BytesIO()
-        with PdfPages(pdf_output) as pdf:
-            pdf.savefig(fig)
-            pdf.savefig(fig2)
+        with prof.span("pdf export"):
+            from matplotlib.backends.backend_pdf import PdfPages
+
+            pdf_output = BytesIO()
+            with PdfPages(pdf_output) as pdf:
+                pdf.savefig(fig)
+                pdf.savefig(fig2)
 
         st.download_button(
             label="📥 Download Charts (PDF)",
@@ -179,4 +179,6 @@ if orders_file and stock_file:
     except Exception as e:
         st.error(f"❌ Error loading files: {e}")
 else:
-    st.warning("📂 Please upload both Orders and Stock files to continue.")
\ No newline at end of file
+    st.warning("📂 Please upload both Orders and Stock files to continue.")
+
+perf.render_panel(prof, "dispatch_vip_stable")
@@ -8,28 +8,54 @@ st.set_page_config(
 )
 
 # Imports
-from streamlit_option_menu import option_menu
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-from matplotlib.backends.backend_pdf import PdfPages
+from datetime import date
+import dataset_registry
+import dispatch_core
+import dispatch_ledger
+import dispatch_report
+import dispatch_slips
+import dispatch_view
+import jobs
+import perf
 
 # Show logo
 st.image("prg.png", width=250)
 
 # Title
 st.title("📦 Client Dispatch and Satisfaction Dashboard")
+prof = perf.start_run("dispatch_vip")
+
+
+def dispatch_job(job, merged_df, stock_df, strategy, params):
+    """Automatic dispatch (no manual edits) written as the Dispatch/Audit workbook."""
+    job.progress(0, "Allocating stock")
+    dispatch_core.STRATEGIES[strategy](merged_df, stock_df, **params)
+    merged_df["To_Give"] = merged_df["Auto_Dispatch_Qty"]
+    summary = dispatch_report.summarize(merged_df)
+    merged_df["Satisfaction (%)"] = summary.satisfaction
+    job.progress(0.6, "Writing workbook")
+    return "All_Tables_Dispatch_Audit.xlsx", dispatch_report.to_excel(merged_df, summary)
+
+
+def slips_job(job, lines, fmt):
+    """One delivery slip per client, zipped."""
+    archive = dispatch_slips.slips_zip(
+        lines, fmt, progress=lambda done, total: job.progress(done / total, f"{done}/{total} batches of clients")
+    )
+    return f"Delivery_Slips_{fmt}.zip", archive
+
 
 # Upload
 st.sidebar.header("📁 Upload Files")
-orders_file = st.sidebar.file_uploader("Upload Orders File", type=["xlsx"])
-stock_file = st.sidebar.file_uploader("Upload Stock File", type=["xlsx"])
+with prof.span("read files"):
+    orders_key = dataset_registry.pick_key("Upload Orders File", key="orders", container=st.sidebar)
+    stock_key = dataset_registry.pick_key("Upload Stock File", key="stock", container=st.sidebar)
 
-if orders_file and stock_file:
+if orders_key is not None and stock_key is not None:
     try:
-        orders_df = pd.read_excel(orders_file)
-        stock_df = pd.read_excel(stock_file)
+        orders_df = dataset_registry.registry().get(orders_key)
+        stock_df = dataset_registry.registry().get(stock_key)
         st.success("✅ Files loaded successfully!")
 
         # Column mapping
@@ -43,6 +69,32 @@ if orders_file and stock_file:
         vip_col = st.sidebar.selectbox("VIP Flag Column", orders_columns)  # VIP Flag
         stock_product_col = st.sidebar.selectbox("Product Column (Stock)", stock_columns)
         stock_qty_col = st.sidebar.selectbox("Stock Quantity Column", stock_columns)
+        strategy, params = dispatch_view.pick_strategy("greedy_vip", orders_columns)
+        background_mode = st.sidebar.checkbox(
+            "🕒 Background report",
+            help="Skip the interactive view: the automatic dispatch workbook is built as a background job."
+        )
+        ledger_mode = st.sidebar.checkbox(
+            "📒 Carry over backorders",
+            help="Dispatch against the ledger of open backorders: today's new orders and stock receipts are added to it."
+        )
+        cumulative_orders = ledger_mode and st.sidebar.checkbox(
+            "Orders file is the full order history",
+            help="Unticked, the orders file holds the new orders since the last recorded dispatch."
+        )
+        stock_is_snapshot = ledger_mode and st.sidebar.checkbox(
+            "Stock file is a full count",
+            help="Unticked, the stock file holds the receipts since the last recorded dispatch."
+        )
+
+        # Same allocation and parameters, files and mapping: same dispatch (cache key for the allocation, client index and KPIs)
+        version = (
+            strategy, orders_key, stock_key, product_col, client_col, qty_ordered_col, vip_col, stock_product_col, stock_qty_col,
+            tuple(sorted(params.items()))
+        )
+        if ledger_mode:
+            ledger = dispatch_ledger.get_ledger()
+            version += ("ledger", ledger.version, stock_is_snapshot, cumulative_orders)
 
         # Rename columns
         orders_df = orders_df.rename(columns={
@@ -56,36 +108,59 @@ if orders_file and stock_file:
             stock_qty_col: "Available_Qty"
         })
 
-        # Merge Data
-        merged_df = orders_df.merge(stock_df, on="Product", how="left")
-        merged_df["Available_Qty"] = pd.to_numeric(merged_df["Available_Qty"], errors="coerce").fillna(0)
-        merged_df["Ordered_Qty"] = pd.to_numeric(merged_df["Ordered_Qty"], errors="coerce").fillna(0)
-        merged_df["VIP"] = pd.to_numeric(merged_df["VIP"], errors="coerce").fillna(0)
-
-        # Dispatch Calculation with VIP priority
-        merged_df["Auto_Dispatch_Qty"] = 0
+        # Merge Data (or the open backorders plus the new lines)
+        with prof.span("merge") as span:
+            if ledger_mode:
+                plan = dispatch_view.ledger_plan(
+                    version, date.today().isoformat(), orders_df, stock_df, stock_is_snapshot, cumulative_orders
+                )
+                merged_df, stock_df = plan.book.copy(), plan.stock
+            else:
+                merged_df = orders_df.merge(stock_df, on="Product", how="left")
+            merged_df["Available_Qty"] = pd.to_numeric(merged_df["Available_Qty"], errors="coerce").fillna(0)
+            merged_df["Ordered_Qty"] = pd.to_numeric(merged_df["Ordered_Qty"], errors="coerce").fillna(0)
+            merged_df["VIP"] = pd.to_numeric(merged_df["VIP"], errors="coerce").fillna(0)
+            span["rows"] = len(merged_df)
 
-        for product, group in merged_df.groupby("Product"):
-            total_stock = stock_df[stock_df["Product"] == product]["Available_Qty"].sum()
+        if ledger_mode:
+            st.subheader("📒 Backorder Ledger")
+            if "ledger_message" in st.session_state:
+                st.success(st.session_state.pop("ledger_message"))
+            stats = ledger.stats()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Open backorder lines", f"{stats['open_lines']:,}")
+            col2.metric("Quantity owed", f"{stats['backorder_qty']:,.0f}")
+            col3.metric("Recorded dispatches", stats["runs"])
+            st.caption(
+                f"Today: {int(plan.new.sum()):,} new lines and {plan.carried_over:,} carried-over backorders "
+                f"on {merged_df['Product'].nunique():,} products."
+            )
+            if merged_df.empty:
+                st.info("Nothing to dispatch: no new order lines and no stock for the open backorders.")
+                perf.render_panel(prof, "dispatch_vip")
+                st.stop()
 
-            vip_group = group[group["VIP"] == 1].copy()
-            normal_group = group[group["VIP"] == 0].copy()
+        if background_mode:
+            if st.button("🕒 Run dispatch in background"):
+                jobs.get_runner().submit(
+                    "dispatch", f"Dispatch {len(merged_df):,} order lines", dispatch_job, merged_df, stock_df, strategy, params
+                )
+                st.success("🕒 Dispatch started in the background.")
+            jobs.render_jobs(["dispatch"], key="dispatch_jobs")
+            perf.render_panel(prof, "dispatch_vip")
+            st.stop()
 
-            for subset in [vip_group, normal_group]:
-                for i in subset.index:
-                    if total_stock <= 0:
-                        break
-                    requested = merged_df.at[i, "Ordered_Qty"]
-                    allocated = min(requested, total_stock)
-                    merged_df.at[i, "Auto_Dispatch_Qty"] = allocated
-                    total_stock -= allocated
+        # Dispatch Calculation (VIP priority by default)
+        with prof.span("allocation", rows=len(merged_df)):
+            dispatch_view.allocate(version, merged_df, stock_df, **params)
 
         merged_df["To_Give"] = merged_df["Auto_Dispatch_Qty"]
 
         # Client selector
         st.subheader("✍️ Adjust Quantities for a Client")
-        selected_client = st.selectbox("Choose Client", merged_df["Client"].unique())
-        client_data = merged_df[merged_df["Client"] == selected_client].copy()
+        clients = dispatch_view.client_index(version, merged_df)
+        selected_client = dispatch_view.pick_client(clients)
+        client_data = clients.rows(merged_df, selected_client).copy()
 
         st.markdown("### You can adjust 'To_Give'. Cannot exceed ordered quantity.")
 
@@ -100,8 +175,11 @@ if orders_file and stock_file:
             updated_val = min(row["To_Give"], max_allowed)
             merged_df.at[client_data.index[i], "To_Give"] = updated_val
 
-        # Satisfaction Calculation
-        merged_df["Satisfaction (%)"] = round((merged_df["To_Give"] / merged_df["Ordered_Qty"]) * 100, 2).fillna(0)
+        # Satisfaction, client and stock KPIs (computed once per dispatch and set of edits)
+        edits = (selected_client, tuple(clients.rows(merged_df, selected_client)["To_Give"]))
+        with prof.span("summary", rows=len(merged_df)):
+            summary = dispatch_view.summary(version, edits, merged_df)
+        merged_df["Satisfaction (%)"] = summary.satisfaction
 
         # Display Dispatch Summary
         st.subheader("📋 Dispatch Summary")
@@ -109,74 +187,81 @@ if orders_file and stock_file:
 
         # Satisfaction Chart
         st.subheader("📊 Client Satisfaction Overview")
-        satisfaction_by_client = merged_df.groupby("Client")["Satisfaction (%)"].mean().reset_index()
-
-        fig, ax = plt.subplots(figsize=(10, 5))
-        sns.barplot(data=satisfaction_by_client, x="Client", y="Satisfaction (%)", palette="viridis", ax=ax)
-        ax.set_ylim(0, 110)
-        ax.set_title("Client Satisfaction (%)")
-        ax.set_xlabel("Client")
-        ax.set_ylabel("Satisfaction (%)")
-        for bar in ax.patches:
-            ax.annotate(f'{bar.get_height():.1f}%', (bar.get_x() + bar.get_width() / 2, bar.get_height() + 1),
-                        ha='center')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        satisfaction_by_client = summary.clients
+
+        with prof.span("satisfaction chart", rows=len(satisfaction_by_client)):
+            # Plotting libraries are only loaded once there is something to plot
+            import seaborn as sns
+
+            fig = dispatch_report.figure(figsize=(10, 5))
+            ax = fig.subplots()
+            sns.barplot(data=satisfaction_by_client, x="Client", y="Satisfaction (%)", palette="viridis", ax=ax)
+            ax.set_ylim(0, 110)
+            ax.set_title("Client Satisfaction (%)")
+            ax.set_xlabel("Client")
+            ax.set_ylabel("Satisfaction (%)")
+            for bar in ax.patches:
+                ax.annotate(f'{bar.get_height():.1f}%', (bar.get_x() + bar.get_width() / 2, bar.get_height() + 1),
+                            ha='center')
+            ax.tick_params(axis="x", labelrotation=45)
+            st.pyplot(fig)
 
         # Fulfillment Pie Chart
         st.subheader("🥧 Overall Fulfillment")
-        total_ordered = merged_df["Ordered_Qty"].sum()
-        total_given = merged_df["To_Give"].sum()
-        fig2, ax2 = plt.subplots()
-        ax2.pie(
-            [total_given, total_ordered - total_given],
-            labels=["Fulfilled", "Unfulfilled"],
-            colors=["#2ecc71", "#e74c3c"],
-            autopct="%1.1f%%",
-            startangle=90,
-            wedgeprops={'edgecolor': 'white'}
-        )
-        ax2.axis("equal")
-        st.pyplot(fig2)
+        with prof.span("fulfillment chart"):
+            fig2 = dispatch_report.figure()
+            ax2 = fig2.subplots()
+            ax2.pie(
+                summary.fulfillment,
+                labels=["Fulfilled", "Unfulfilled"],
+                colors=["#2ecc71", "#e74c3c"],
+                autopct="%1.1f%%",
+                startangle=90,
+                wedgeprops={'edgecolor': 'white'}
+            )
+            ax2.axis("equal")
+            st.pyplot(fig2)
 
         # Stock Audit Table
         st.subheader("🧮 Stock vs Demand Audit")
-        audit = merged_df.groupby("Product").agg({
-            "Ordered_Qty": "sum",
-            "To_Give": "sum",
-            "Available_Qty": "first"
-        }).reset_index()
-        audit["Remaining_Stock"] = audit["Available_Qty"] - audit["To_Give"]
-        audit["Unmet_Demand"] = audit["Ordered_Qty"] - audit["To_Give"]
-        st.dataframe(audit)
-
-        # Download All Tables as Excel
-        tables_output = BytesIO()
-        with pd.ExcelWriter(tables_output, engine="xlsxwriter") as writer:
-            merged_df.to_excel(writer, sheet_name="Dispatch", index=False)
-            audit.to_excel(writer, sheet_name="Audit", index=False)
+        st.dataframe(summary.products)
+
+        # Download All Tables as Excel (with native Excel charts)
+        with prof.span("excel export", rows=len(merged_df)):
+            tables_output = dispatch_report.to_excel(merged_df, summary)
 
         st.download_button(
-            label="📥 Download All Tables (Excel)",
-            data=tables_output.getvalue(),
+            label="📥 Download All Tables and Charts (Excel)",
+            data=tables_output,
             file_name="All_Tables_Dispatch_Audit.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
-        # Download Charts as PDF
-        chart_pdf = BytesIO()
-        with PdfPages(chart_pdf) as pdf_pages:
-            pdf_pages.savefig(fig)
-            pdf_pages.savefig(fig2)
+        # Record the final quantities: what is still owed is carried over to the next run
+        if ledger_mode and st.button("📒 Record this dispatch in the ledger"):
+            run = ledger.commit(plan, merged_df["To_Give"])
+            st.session_state["ledger_message"] = (
+                f"Dispatch #{run} recorded: {merged_df['To_Give'].sum():,.0f} units given, "
+                f"{(merged_df['Ordered_Qty'] - merged_df['To_Give']).sum():,.0f} carried over."
+            )
+            st.rerun()
 
-        st.download_button(
-            label="📥 Download Charts (PDF)",
-            data=chart_pdf.getvalue(),
-            file_name="Dispatch_Charts.pdf",
-            mime="application/pdf"
+        # Delivery slips: one file per client, built in the background
+        st.subheader("📦 Delivery Slips")
+        slip_format = st.radio(
+            "Slip format", list(dispatch_slips.FORMATS), format_func=dispatch_slips.FORMATS.get, horizontal=True
         )
+        if st.button(f"📦 Generate slips for {len(clients):,} clients (ZIP)"):
+            jobs.get_runner().submit(
+                "slips", f"{dispatch_slips.FORMATS[slip_format]} slips for {len(clients):,} clients", slips_job,
+                merged_df[["Client"] + dispatch_slips.SLIP_COLUMNS].copy(), slip_format
+            )
+            st.success("🕒 Slip generation started in the background.")
+        jobs.render_jobs(["slips"], key="slips_jobs")
 
     except Exception as e:
         st.error(f"❌ Error loading files: {e}")
 else:
     st.warning("📂 Please upload both Orders and Stock files to continue.")
+
+perf.render_panel(prof, "dispatch_vip")
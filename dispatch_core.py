@@ -0,0 +1,210 @@
+"""Allocation strategies shared by the dispatch dashboards.
+
+Each strategy takes the merged order book (one row per order line with
+``Product``, ``Ordered_Qty`` and, when VIPs are used, ``VIP``) and the stock
+table (``Product``, ``Available_Qty``), and fills ``Auto_Dispatch_Qty`` in place.
+"""
+import numpy as np
+import pandas as pd
+
+
+def stock_by_product(stock_df):
+    """Total available quantity per product."""
+    return stock_df.groupby("Product")["Available_Qty"].sum()
+
+
+def greedy_vip(df, stock_df):
+    """Serve VIP lines first, then the others, each in full while stock lasts."""
+    df["Auto_Dispatch_Qty"] = 0
+    stock = stock_by_product(stock_df)
+
+    for product, group in df.groupby("Product"):
+        total_stock = stock.get(product, 0)
+
+        for priority in [1, 0]:  # VIP first
+            sub = group[group["VIP"] == priority]
+            for i in sub.index:
+                if total_stock <= 0:
+                    break
+                requested = df.at[i, "Ordered_Qty"]
+                allocated = min(requested, total_stock)
+                df.at[i, "Auto_Dispatch_Qty"] = allocated
+                total_stock -= allocated
+    return df
+
+
+def _split(group, stock_left, boost=0):
+    """Share ``stock_left`` across ``group`` in proportion to the ordered quantities."""
+    total_ordered = group["Ordered_Qty"].sum()
+    if total_ordered == 0 or stock_left == 0:
+        return [0] * len(group), 0
+
+    alloc = []
+    for _, row in group.iterrows():
+        proportional = (row["Ordered_Qty"] / total_ordered) * stock_left
+        to_give = min(row["Ordered_Qty"], int(round(proportional))) + boost
+        alloc.append(to_give)
+
+    # Adjust if overallocated
+    while sum(alloc) > stock_left:
+        for i in range(len(alloc)):
+            if alloc[i] > 0:
+                alloc[i] -= 1
+                if sum(alloc) <= stock_left:
+                    break
+    return alloc, sum(alloc)
+
+
+def proportional(df, stock_df):
+    """Share each product's stock in proportion to the ordered quantities."""
+    df["Auto_Dispatch_Qty"] = 0
+    stock = stock_by_product(stock_df)
+
+    for product, group in df.groupby("Product"):
+        alloc, _ = _split(group, stock.get(product, 0))
+        df.loc[group.index, "Auto_Dispatch_Qty"] = alloc
+    return df
+
+
+def proportional_vip(df, stock_df, vip_boost=5):
+    """Proportional split for VIP lines (plus ``vip_boost`` each), then the rest."""
+    df["Auto_Dispatch_Qty"] = 0
+    stock = stock_by_product(stock_df)
+
+    for product, group in df.groupby("Product"):
+        stock_qty = stock.get(product, 0)
+        if stock_qty == 0:
+            continue
+
+        vip_group = group[group["VIP"] == 1]
+        regular_group = group[group["VIP"] == 0]
+
+        vip_alloc, vip_sum = _split(vip_group, stock_qty, boost=vip_boost)
+        reg_alloc, _ = _split(regular_group, stock_qty - vip_sum)
+
+        df.loc[vip_group.index, "Auto_Dispatch_Qty"] = vip_alloc
+        df.loc[regular_group.index, "Auto_Dispatch_Qty"] = reg_alloc
+    return df
+
+
+def _products(df, stock_df):
+    """Product code of each line and the stock of each code.
+
+    Lines without a product get the extra code ``n_products``, with no stock.
+    """
+    codes, uniques = pd.factorize(df["Product"])
+    supply = stock_by_product(stock_df).reindex(uniques, fill_value=0).to_numpy(dtype=float)
+    codes = np.where(codes < 0, len(uniques), codes)
+    return codes, np.append(np.maximum(supply, 0), 0)
+
+
+def _cumsum_by_group(values, codes):
+    """Running sum of ``values`` restarting at each run of equal ``codes`` (sorted)."""
+    total = np.cumsum(values)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(values)])
+    return total - np.repeat(total[starts] - values[starts], sizes)
+
+
+def _assign(df, order, alloc):
+    """Write the allocations of the lines sorted by ``order`` back to ``Auto_Dispatch_Qty``."""
+    result = np.empty(len(df))
+    result[order] = alloc
+    df["Auto_Dispatch_Qty"] = result.astype(df["Ordered_Qty"].dtype) if df["Ordered_Qty"].dtype.kind in "iu" else result
+    return df
+
+
+def max_min_fair(df, stock_df, vip_weight=2):
+    """Water-filling: raise every line together until it is served in full or the stock runs out.
+
+    Small orders are served in full before large ones get more, and VIP lines
+    rise ``vip_weight`` times as fast. The water level of each product comes
+    from one sort of its lines by ``Ordered_Qty / weight`` (no unit-by-unit
+    loop); shares are then rounded down and the units left over go to the
+    largest remainders.
+    """
+    df["Auto_Dispatch_Qty"] = 0
+    if df.empty:
+        return df
+    codes, supply = _products(df, stock_df)
+    n = len(supply)
+    demand = np.maximum(df["Ordered_Qty"].to_numpy(dtype=float), 0)
+    weight = np.ones(len(df))
+    if "VIP" in df:
+        weight[df["VIP"].to_numpy() == 1] = vip_weight
+
+    # Lines by product, then by the level at which each one is served in full
+    order = np.lexsort((demand / weight, codes))
+    c, d, w = codes[order], demand[order], weight[order]
+    level = d / w
+
+    # Stock needed to reach each line's level: the lines before in full, the others up to that level
+    needed = _cumsum_by_group(d, c) + level * (np.bincount(c, weights=w, minlength=n)[c] - _cumsum_by_group(w, c))
+    full = needed <= supply[c] + 1e-9
+    rising = np.bincount(c[~full], weights=w[~full], minlength=n)
+    left = supply - np.bincount(c[full], weights=d[full], minlength=n)
+    water = np.divide(left, rising, out=np.zeros(n), where=rising > 0)
+    share = np.where(full, d, w * water[c])
+
+    # Whole units: round down, then one more unit for the largest remainders
+    alloc = np.where(full, d, np.floor(share + 1e-9))
+    units_left = np.floor(supply - np.bincount(c, weights=alloc, minlength=n) + 1e-9)
+    remainder = np.where(full, -1, share - alloc)
+    by_remainder = np.lexsort((-remainder, c))
+    rank = _cumsum_by_group(np.ones(len(c)), c[by_remainder]) - 1
+    bump = by_remainder[(rank < units_left[c[by_remainder]]) & (remainder[by_remainder] >= 0)]
+    alloc[bump] += 1
+    return _assign(df, order, np.minimum(alloc, d))
+
+
+def _order_dates(values):
+    """``values`` as datetimes: ISO dates first, then day-first text (dd/mm/yyyy) one by one.
+
+    Anything else is ``NaT``.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    dates = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    rest = dates.isna() & values.notna()
+    if rest.any():
+        dates[rest] = pd.to_datetime(values[rest], errors="coerce", dayfirst=True, format="mixed")
+    return dates
+
+
+def fifo(df, stock_df, date_column=None):
+    """First come, first served: higher VIP tiers first, then by order date, then in file order.
+
+    Without ``date_column`` each tier is served in file order; undated lines
+    come after the dated ones. The lines are sorted once by product, tier,
+    date and position, and each product's stock is spread down the running
+    total of its demand (no row loop).
+    """
+    df["Auto_Dispatch_Qty"] = 0
+    if df.empty:
+        return df
+    codes, supply = _products(df, stock_df)
+    demand = np.maximum(df["Ordered_Qty"].to_numpy(dtype=float), 0)
+
+    keys = [np.arange(len(df))]
+    if date_column:
+        dates = _order_dates(df[date_column])
+        day_codes, days = pd.factorize(dates, sort=True)
+        keys.append(np.where(day_codes < 0, len(days), day_codes))
+    if "VIP" in df:
+        keys.append(-pd.to_numeric(df["VIP"], errors="coerce").fillna(0).to_numpy(dtype=float))
+    keys.append(codes)
+    order = np.lexsort(keys)
+
+    c, d = codes[order], demand[order]
+    ordered_before = _cumsum_by_group(d, c) - d
+    return _assign(df, order, np.clip(supply[c] - ordered_before, 0, d))
+
+
+# Strategies by name (the pages' dispatch version starts with one of these)
+STRATEGIES = {
+    "greedy_vip": greedy_vip,
+    "proportional": proportional,
+    "proportional_vip": proportional_vip,
+    "max_min_fair": max_min_fair,
+    "fifo": fifo,
+}
@@ -0,0 +1,292 @@
+"""Persistent backorder ledger for incremental daily dispatch.
+
+Order lines and stock are kept in a local SQLite file between runs. A daily
+``plan`` loads the open lines (ordered minus delivered) of the products that
+can move, i.e. those with new lines, new stock or stock left over, instead of
+the whole history. ``commit`` records what was given, keeps the stock left and
+carries the rest over as backorders for the next run.
+
+The orders file is either a delta (the orders received since the last run:
+every line is new) or, with ``cumulative``, the whole order history: each line
+is stored with a hash of its values, and a line is new when the file holds more
+copies of it than the ledger does. A stock file holds the receipts since the
+last run, or with ``stock_is_snapshot`` the full on-hand count. Delta and
+receipt files are recorded per upload, i.e. per content and day: the same file
+recorded twice the same day (e.g. the page rerun after recording) is only
+counted once, while an identical file on another day is new orders or stock.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import date
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from ref_store import DATA_DIR
+
+DEFAULT_PATH = os.path.join(DATA_DIR, "dispatch_ledger.sqlite")
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}T")
+
+
+def _records(df):
+    """One JSON object per row of ``df`` (dates as ISO strings)."""
+    text = df.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+    return text.splitlines() if len(df) else []
+
+
+def _frame(records):
+    """Inverse of ``_records``: a frame with the ISO date columns parsed back."""
+    if not records:
+        return pd.DataFrame()
+    df = pd.read_json(StringIO("\n".join(records)), lines=True, dtype=False, convert_dates=False)
+    for column in df.select_dtypes(include=["object", "string"]).columns:
+        values = df[column].dropna()
+        if len(values) and values.astype(str).str.match(ISO_DATE).all():
+            df[column] = pd.to_datetime(df[column], format="ISO8601")
+    return df
+
+
+def _content_hashes(df):
+    """Hash of each line's values.
+
+    Numbers are hashed as floats and everything else as text, so a line keeps
+    its hash when another file gives its columns other dtypes.
+    """
+    canonical = df.apply(
+        lambda col: col.astype(float) if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col)
+        else col.astype(str)
+    )
+    return pd.Series(pd.util.hash_pandas_object(canonical, index=False).to_numpy()).map("{:016x}".format)
+
+
+def _upload_key(df, day):
+    """Key of an uploaded file on ``day``: a hash of its content plus the day."""
+    digest = hashlib.sha1("\n".join(_records(df)).encode("utf-8")).hexdigest()
+    return f"{day}:{digest}"
+
+
+class LedgerPlan:
+    """A dispatch of the open book, to be ``commit``-ed once the quantities are final.
+
+    ``book`` is the merged order book handed to the allocation strategies
+    (``Ordered_Qty`` is what is still owed, ``Backorder_Since`` the day the
+    line entered the ledger) and ``stock`` the available quantity per product.
+    ``uploads`` are the ``(kind, key, quantity)`` files the commit records.
+    """
+
+    def __init__(self, book, stock, keys, contents, new, uploads, version, day):
+        self.book = book
+        self.stock = stock
+        self.keys = keys
+        self.contents = contents
+        self.new = new
+        self.uploads = uploads
+        self.version = version
+        self.day = day
+
+    @property
+    def carried_over(self):
+        return int((~self.new).sum())
+
+
+class DispatchLedger:
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS lines (
+                    line_hash TEXT PRIMARY KEY,
+                    product TEXT NOT NULL,
+                    ordered REAL NOT NULL,
+                    delivered REAL NOT NULL DEFAULT 0,
+                    since TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    content_hash TEXT
+                );
+                CREATE INDEX IF NOT EXISTS open_lines ON lines (product) WHERE delivered < ordered;
+                CREATE TABLE IF NOT EXISTS stock (product TEXT PRIMARY KEY, on_hand REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS uploads (
+                    kind TEXT NOT NULL, upload_key TEXT NOT NULL, day TEXT NOT NULL, quantity REAL NOT NULL,
+                    PRIMARY KEY (kind, upload_key)
+                );
+                CREATE TABLE IF NOT EXISTS deliveries (run INTEGER NOT NULL, day TEXT NOT NULL, line_hash TEXT NOT NULL, quantity REAL NOT NULL);
+            """)
+            # Ledgers from before content hashes: a line's key was "<content hash>:<occurrence>"
+            if "content_hash" not in [row[1] for row in conn.execute("PRAGMA table_info(lines)")]:
+                conn.execute("ALTER TABLE lines ADD COLUMN content_hash TEXT")
+            conn.execute(
+                "UPDATE lines SET content_hash = substr(line_hash, 1, instr(line_hash, ':') - 1) WHERE content_hash IS NULL"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS line_contents ON lines (content_hash)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _meta(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    @property
+    def version(self):
+        """Increases on every commit."""
+        with self._connect() as conn:
+            return self._meta(conn, "version", 0)
+
+    def stats(self):
+        with self._connect() as conn:
+            lines, owed = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(ordered - delivered), 0) FROM lines WHERE delivered < ordered"
+            ).fetchone()
+            on_hand = conn.execute("SELECT COALESCE(SUM(on_hand), 0) FROM stock").fetchone()[0]
+            return {"open_lines": lines, "backorder_qty": owed, "on_hand": on_hand, "runs": self._meta(conn, "version", 0)}
+
+    def backorders(self):
+        """Open quantity per product, largest first."""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT product AS Product, COUNT(*) AS Open_Lines, SUM(ordered - delivered) AS Backorder_Qty, "
+                "MIN(since) AS Oldest FROM lines WHERE delivered < ordered GROUP BY product ORDER BY Backorder_Qty DESC",
+                conn
+            )
+
+    def plan(self, orders_df, stock_df, stock_is_snapshot=False, cumulative=False, day=None):
+        """Open book for ``day``'s run (default today) from the renamed orders and stock frames.
+
+        The orders file holds the new orders, or with ``cumulative`` the whole
+        order history. The stock file holds the receipts since the last run, or
+        with ``stock_is_snapshot`` the full on-hand count of its products.
+        """
+        day = day or date.today().isoformat()
+        orders = orders_df.copy()
+        orders["Product"] = orders["Product"].astype(str)
+        orders["Ordered_Qty"] = pd.to_numeric(orders["Ordered_Qty"], errors="coerce").fillna(0)
+        if "VIP" in orders:
+            orders["VIP"] = pd.to_numeric(orders["VIP"], errors="coerce").fillna(0)
+        contents = _content_hashes(orders)
+        occurrence = contents.groupby(contents).cumcount().to_numpy()
+        orders_key = None if cumulative else _upload_key(orders, day)
+
+        stock = stock_df.assign(Product=stock_df["Product"].astype(str))
+        stock = pd.to_numeric(stock["Available_Qty"], errors="coerce").fillna(0).groupby(stock["Product"]).sum()
+        receipt_key = None if stock_is_snapshot else _upload_key(stock.reset_index(), day)
+
+        with self._connect() as conn:
+            version = self._meta(conn, "version", 0)
+            uploaded = {
+                kind for kind, key in (("orders", orders_key), ("receipt", receipt_key))
+                if key is not None and conn.execute(
+                    "SELECT 1 FROM uploads WHERE kind = ? AND upload_key = ?", (kind, key)
+                ).fetchone()
+            }
+            conn.execute("CREATE TEMP TABLE incoming (content_hash TEXT PRIMARY KEY)")
+            conn.executemany("INSERT INTO incoming VALUES (?)", ((h,) for h in contents.unique()))
+            stored = dict(conn.execute(
+                "SELECT content_hash, COUNT(*) FROM lines WHERE content_hash IN (SELECT content_hash FROM incoming) "
+                "GROUP BY content_hash"
+            ).fetchall())
+            on_hand = pd.Series(dict(conn.execute("SELECT product, on_hand FROM stock").fetchall()), dtype=float)
+
+            stored_copies = contents.map(stored).fillna(0).to_numpy(dtype=np.int64)
+            if cumulative:
+                # Only the copies of a line beyond those already in the ledger are new
+                new = occurrence >= stored_copies
+            else:
+                new = np.full(len(orders), "orders" not in uploaded)
+            uploads = [] if cumulative or "orders" in uploaded else [("orders", orders_key, float(orders["Ordered_Qty"].sum()))]
+            if stock_is_snapshot:
+                available = stock.combine_first(on_hand)
+            elif "receipt" in uploaded:
+                available = on_hand
+            else:
+                available = on_hand.add(stock, fill_value=0)
+                uploads.append(("receipt", receipt_key, float(stock.sum())))
+            available = available.clip(lower=0)
+
+            # Products that can move: new lines, new stock or stock left over
+            products = set(orders["Product"][new]) | set(available.index[available > 0])
+            if "receipt" not in uploaded:
+                products |= set(stock.index)
+            conn.execute("CREATE TEMP TABLE moving (product TEXT PRIMARY KEY)")
+            conn.executemany("INSERT INTO moving VALUES (?)", ((p,) for p in products))
+            rows = conn.execute(
+                "SELECT line_hash, content_hash, ordered - delivered, since, data FROM lines "
+                "WHERE delivered < ordered AND product IN (SELECT product FROM moving) ORDER BY since, rowid"
+            ).fetchall()
+
+        # New lines are keyed by their content and copy number, after the copies already stored
+        new_contents = contents[new]
+        copy = stored_copies[new] + new_contents.groupby(new_contents).cumcount().to_numpy()
+        new_keys = [f"{h}:{n}" for h, n in zip(new_contents, copy)]
+
+        # Open lines first (oldest first), then today's new lines
+        old_keys, old_contents, owed, since, records = zip(*rows) if rows else ((), (), (), (), ())
+        old = _frame(list(records)).assign(Ordered_Qty=list(owed), Backorder_Since=list(since))
+        today = orders[new].assign(Backorder_Since=day)
+        book = pd.concat([old, today], ignore_index=True) if rows else today.reset_index(drop=True)
+        book["Available_Qty"] = book["Product"].astype(str).map(available).fillna(0)
+
+        stock_table = available[available.index.isin(products)].rename("Available_Qty").rename_axis("Product").reset_index()
+        return LedgerPlan(
+            book, stock_table, list(old_keys) + new_keys, list(old_contents) + new_contents.tolist(),
+            np.r_[np.zeros(len(rows), dtype=bool), np.ones(int(new.sum()), dtype=bool)],
+            uploads, version, day
+        )
+
+    def commit(self, plan, given):
+        """Record ``given`` (aligned with ``plan.book``) as delivered; returns the run number.
+
+        New lines enter the ledger, the stock left is kept per product, any
+        quantity still owed stays open and the plan's uploads are recorded.
+        """
+        book = plan.book
+        given = np.clip(np.asarray(given, dtype=float), 0, book["Ordered_Qty"].to_numpy(dtype=float))
+        used = pd.Series(given).groupby(book["Product"].to_numpy()).sum()
+        left = plan.stock.set_index("Product")["Available_Qty"].sub(used, fill_value=0).clip(lower=0)
+        new_lines = book[plan.new].drop(columns=["Backorder_Since", "Available_Qty"])
+
+        with self._connect() as conn:
+            if self._meta(conn, "version", 0) != plan.version:
+                raise ValueError("The ledger changed since this dispatch was planned: reload the page and check it again.")
+            run = plan.version + 1
+            keys = np.asarray(plan.keys, dtype=object)
+            contents = np.asarray(plan.contents, dtype=object)
+            conn.executemany(
+                "INSERT INTO lines (line_hash, product, ordered, delivered, since, data, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (key, product, ordered, delivered, plan.day, record, content)
+                    for key, product, ordered, delivered, record, content in zip(
+                        keys[plan.new], new_lines["Product"], new_lines["Ordered_Qty"].astype(float),
+                        given[plan.new], _records(new_lines), contents[plan.new]
+                    )
+                )
+            )
+            carried = ~plan.new & (given > 0)
+            conn.executemany(
+                "UPDATE lines SET delivered = delivered + ? WHERE line_hash = ?",
+                zip(given[carried].tolist(), keys[carried])
+            )
+            conn.executemany("INSERT OR REPLACE INTO stock VALUES (?, ?)", left.items())
+            conn.executemany(
+                "INSERT INTO uploads VALUES (?, ?, ?, ?)",
+                ((kind, key, plan.day, quantity) for kind, key, quantity in plan.uploads)
+            )
+            conn.executemany(
+                "INSERT INTO deliveries VALUES (?, ?, ?, ?)",
+                ((run, plan.day, key, q) for key, q in zip(keys[given > 0], given[given > 0].tolist()))
+            )
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (json.dumps(run),))
+        return run
+
+
+@st.cache_resource
+def get_ledger():
+    """The server-wide ledger, shared by every session."""
+    return DispatchLedger()
@@ -0,0 +1,189 @@
+"""Dispatch KPIs shared by the dashboards, their Excel reports and PDF charts.
+
+``summarize`` derives the line satisfaction, the per-client and per-product
+tables and the global totals from a dispatch result (``Client``, ``Product``,
+``Ordered_Qty``, ``To_Give``, ``Available_Qty``) in one pass: the client and
+product keys are factorized once and every aggregate is a ``np.bincount`` over
+those codes. Rows with a missing key go to an extra bucket, so they still count
+in the totals but not in the tables (as with ``groupby``). The keys do not
+change when quantities are edited, so ``GroupKeys`` can be built once per
+order book and reused.
+"""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+
+class DispatchSummary:
+    def __init__(self, satisfaction, clients, products, total_ordered, total_given):
+        self.satisfaction = satisfaction
+        self.clients = clients
+        self.products = products
+        self.total_ordered = total_ordered
+        self.total_given = total_given
+
+    @property
+    def fulfillment(self):
+        """``[given, not given]`` quantities for the fulfillment pie."""
+        return [self.total_given, self.total_ordered - self.total_given]
+
+
+def _group_codes(df, keys):
+    """Group code of each row (sorted like ``groupby``) and the table of group keys.
+
+    Rows with a missing key get code ``n_groups``.
+    """
+    codes = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    levels = []
+    for key in keys:
+        key_codes, uniques = pd.factorize(df[key], sort=True)
+        missing |= key_codes < 0
+        codes = codes * max(len(uniques), 1) + key_codes
+        levels.append(uniques)
+    present, inverse = np.unique(codes[~missing], return_inverse=True)
+    groups = np.full(len(df), len(present), dtype=np.int64)
+    groups[~missing] = inverse
+    positions = np.unravel_index(present, [max(len(uniques), 1) for uniques in levels])
+    table = pd.DataFrame({key: uniques.take(pos) for key, uniques, pos in zip(keys, levels, positions)})
+    return groups, table
+
+
+def _sums(groups, n_groups, values, dtype):
+    sums = np.bincount(groups, weights=values, minlength=n_groups + 1)
+    # Keep integer columns integer, as groupby().sum() would
+    return sums.astype(dtype) if np.issubdtype(dtype, np.integer) else sums
+
+
+def _first(groups, n_groups, values):
+    """Value of the first row of each group."""
+    first_row = np.full(n_groups + 1, len(groups), dtype=np.int64)
+    np.minimum.at(first_row, groups, np.arange(len(groups)))
+    return values[first_row[:n_groups]]
+
+
+class GroupKeys:
+    """Factorized client and product keys of a merged order book."""
+
+    def __init__(self, df, client_keys=("Client",)):
+        self.client_keys = list(client_keys)
+        self.client_groups, self.clients = _group_codes(df, self.client_keys)
+        self.product_groups, self.products = _group_codes(df, ["Product"])
+
+
+def summarize(df, keys=None, client_keys=("Client",), vip_bonus=0, stock_label="Remaining_Stock", satisfaction_given=None):
+    """All the dispatch KPIs of ``df`` (see the module docstring).
+
+    ``keys`` are the ``GroupKeys`` of ``df`` (built here when not given);
+    ``client_keys`` are the columns the client table is grouped by; VIP lines
+    get ``vip_bonus`` points of satisfaction; ``stock_label`` names the audit's
+    stock-left column. The satisfaction is measured on ``satisfaction_given``
+    (aligned with ``df``) when given, else on ``To_Give``.
+    """
+    if keys is None:
+        keys = GroupKeys(df, client_keys)
+    ordered = df["Ordered_Qty"].to_numpy(dtype=float)
+    given = df["To_Give"].to_numpy(dtype=float)
+    given_for_satisfaction = df["To_Give"] if satisfaction_given is None else pd.Series(satisfaction_given, index=df.index)
+    satisfaction = (given_for_satisfaction / df["Ordered_Qty"] * 100).round(2).fillna(0)
+    if vip_bonus:
+        satisfaction = satisfaction.where(df["VIP"] != 1, satisfaction + vip_bonus)
+    satisfaction = satisfaction.rename("Satisfaction (%)")
+
+    client_groups, clients = keys.client_groups, keys.clients.copy()
+    n_clients = len(clients)
+    clients["Ordered_Qty"] = _sums(client_groups, n_clients, ordered, df["Ordered_Qty"].dtype)[:n_clients]
+    clients["To_Give"] = _sums(client_groups, n_clients, given, df["To_Give"].dtype)[:n_clients]
+    lines = np.bincount(client_groups, minlength=n_clients + 1)
+    clients["Satisfaction (%)"] = (
+        np.bincount(client_groups, weights=satisfaction.to_numpy(dtype=float), minlength=n_clients + 1)[:n_clients]
+        / lines[:n_clients]
+    )
+
+    product_groups, products = keys.product_groups, keys.products.copy()
+    n_products = len(products)
+    ordered_by_product = _sums(product_groups, n_products, ordered, df["Ordered_Qty"].dtype)
+    given_by_product = _sums(product_groups, n_products, given, df["To_Give"].dtype)
+    products["Ordered_Qty"] = ordered_by_product[:n_products]
+    products["To_Give"] = given_by_product[:n_products]
+    products["Available_Qty"] = _first(product_groups, n_products, df["Available_Qty"].to_numpy())
+    products[stock_label] = products["Available_Qty"] - products["To_Give"]
+    products["Unmet_Demand"] = products["Ordered_Qty"] - products["To_Give"]
+
+    # Every row is in exactly one product bucket (the last one for missing products)
+    return DispatchSummary(
+        satisfaction, clients, products,
+        total_ordered=ordered_by_product.sum(), total_given=given_by_product.sum()
+    )
+
+
+def figure(**kwargs):
+    """A matplotlib ``Figure`` on its own Agg canvas.
+
+    Unlike ``plt.subplots()`` it is not registered in pyplot's global figure
+    manager, so sessions rendering in parallel threads do not share state and
+    the figure is freed as soon as it is no longer referenced.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _add_charts(writer, summary):
+    """``Charts`` sheet: fulfillment totals with native pie and satisfaction bar charts.
+
+    The charts are xlsxwriter chart objects bound to the ``Clients`` sheet and
+    to the totals table, so Excel draws them: writing them costs the same
+    whatever the number of clients.
+    """
+    workbook = writer.book
+    sheet = workbook.add_worksheet("Charts")
+    bold = workbook.add_format({"bold": True})
+    sheet.write_row(0, 0, ["Status", "Quantity"], bold)
+    sheet.write_row(1, 0, ["Fulfilled", float(summary.total_given)])
+    sheet.write_row(2, 0, ["Unfulfilled", float(summary.total_ordered - summary.total_given)])
+    sheet.set_column(0, 1, 12)
+
+    pie = workbook.add_chart({"type": "pie"})
+    pie.add_series({
+        "name": "Overall Fulfillment",
+        "categories": ["Charts", 1, 0, 2, 0],
+        "values": ["Charts", 1, 1, 2, 1],
+        "points": [{"fill": {"color": "#2ecc71"}}, {"fill": {"color": "#e74c3c"}}],
+        "data_labels": {"percentage": True},
+    })
+    pie.set_title({"name": "Overall Fulfillment"})
+    sheet.insert_chart("D2", pie)
+
+    n_clients = len(summary.clients)
+    if n_clients:
+        column = summary.clients.columns.get_loc("Satisfaction (%)")
+        bars = workbook.add_chart({"type": "column"})
+        bars.add_series({
+            "name": "Satisfaction (%)",
+            "categories": ["Clients", 1, 0, n_clients, 0],
+            "values": ["Clients", 1, column, n_clients, column],
+            "data_labels": {"value": True, "num_format": '0.0"%"'} if n_clients <= 50 else {},
+        })
+        bars.set_title({"name": "Client Satisfaction (%)"})
+        bars.set_x_axis({"name": "Client"})
+        bars.set_y_axis({"name": "Satisfaction (%)", "min": 0, "max": 110})
+        bars.set_legend({"none": True})
+        bars.set_size({"width": min(max(720, 18 * n_clients), 4000), "height": 400})
+        sheet.insert_chart("D18", bars)
+
+
+def to_excel(df, summary=None):
+    """xlsx bytes with the ``Dispatch`` sheet, plus ``Audit``, ``Clients`` and ``Charts`` from ``summary``."""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name="Dispatch", index=False)
+        if summary is not None:
+            summary.products.to_excel(writer, sheet_name="Audit", index=False)
+            summary.clients.to_excel(writer, sheet_name="Clients", index=False)
+            _add_charts(writer, summary)
+    return output.getvalue()
@@ -0,0 +1,150 @@
+"""Cached allocation, client picker and KPIs shared by the dispatch dashboards.
+
+The per-client adjustment view used to scan the whole order book twice per
+rerun (``unique()`` for the options, a boolean mask for the rows). The
+``ClientIndex`` maps each client to the positions of its lines once per
+dispatch ``version`` (the allocation, the uploaded files and the column
+mapping), so showing a client only touches that client's rows. The dispatch
+KPIs are cached on the same version plus the manual edits.
+
+A dispatch version is ``(strategy, orders key, stock key, *column mapping,
+params)``: the strategy is a ``dispatch_core.STRATEGIES`` name, the keys are
+dataset registry keys, i.e. hashes of the uploaded files, and ``params`` the
+strategy parameters as sorted ``(name, value)`` pairs, so that changing e.g.
+the VIP boost gives a new dispatch whose KPIs are computed again. Allocations
+are memoized on it in a bounded cache shared by all sessions, so planners
+opening the same morning files get the dispatch from cache.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import dispatch_core
+import dispatch_ledger
+import dispatch_report
+
+ALLOCATION_CACHE_ENTRIES = int(os.environ.get("APP_ALLOCATION_CACHE", 32))
+STRATEGY_LABELS = {
+    "greedy_vip": "VIP first",
+    "proportional": "Proportional",
+    "proportional_vip": "Proportional, VIP boost",
+    "max_min_fair": "Max-min fair (water-filling)",
+    "fifo": "First come, first served",
+}
+VIP_STRATEGIES = {"greedy_vip", "proportional_vip"}
+
+
+@st.cache_resource(max_entries=ALLOCATION_CACHE_ENTRIES, show_spinner=False)
+def _allocation(version, params, _merged_df, _stock_df):
+    df = _merged_df.copy()
+    dispatch_core.STRATEGIES[version[0]](df, _stock_df, **dict(params))
+    quantities = df["Auto_Dispatch_Qty"].to_numpy()
+    quantities.flags.writeable = False
+    return quantities
+
+
+def allocate(version, merged_df, stock_df, **params):
+    """Fill ``Auto_Dispatch_Qty`` with the strategy named by ``version[0]``, once per version and params."""
+    merged_df["Auto_Dispatch_Qty"] = _allocation(version, tuple(sorted(params.items())), merged_df, stock_df)
+    return merged_df
+
+
+def pick_strategy(default, columns=(), vip=True, label="⚖️ Allocation Strategy", key="strategy"):
+    """Sidebar choice of the allocation strategy (``default`` first) and its parameters.
+
+    ``columns`` are the orders columns the order date can be picked from.
+    Without a VIP column (``vip=False``) the VIP-only strategies are not
+    offered. Returns ``(name, params)`` for ``allocate``.
+    """
+    names = [default] + [
+        name for name in STRATEGY_LABELS if name != default and (vip or name not in VIP_STRATEGIES)
+    ]
+    name = st.sidebar.selectbox(label, names, format_func=STRATEGY_LABELS.get, key=key)
+    params = {}
+    if name == "proportional_vip":
+        params["vip_boost"] = st.sidebar.number_input("VIP boost (units per line)", min_value=0, value=5, key=f"{key}_boost")
+    elif name == "max_min_fair" and vip:
+        params["vip_weight"] = st.sidebar.number_input(
+            "VIP weight", min_value=1.0, value=2.0, step=0.5, key=f"{key}_weight",
+            help="VIP lines rise this many times faster than the others."
+        )
+    elif name == "fifo":
+        options = [None] + list(columns)
+        dated = [n for n, column in enumerate(options) if column is not None and "date" in str(column).lower()]
+        params["date_column"] = st.sidebar.selectbox(
+            "Order Date Column", options, index=dated[0] if dated else 0, key=f"{key}_date",
+            format_func=lambda column: "(file order)" if column is None else column
+        )
+    return name, params
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def ledger_plan(version, day, _orders_df, _stock_df, stock_is_snapshot=False, cumulative=False):
+    """``DispatchLedger.plan`` for ``day`` once per dispatch ``version``, which must include the ledger version.
+
+    The plan is shared: work on a copy of its ``book``.
+    """
+    return dispatch_ledger.get_ledger().plan(_orders_df, _stock_df, stock_is_snapshot, cumulative, day)
+
+
+class ClientIndex:
+    def __init__(self, clients):
+        """``clients``: the ``Client`` column of the merged order book.
+
+        Lines without a client are listed under a missing-value entry, as ``unique()`` listed them.
+        """
+        self.positions = clients.groupby(clients, sort=False, dropna=False).indices
+        self.clients = list(self.positions)
+        self._search_labels = np.array([str(client).casefold() for client in self.clients], dtype=str)
+
+    def __len__(self):
+        return len(self.clients)
+
+    def rows(self, df, client):
+        """``client``'s lines of ``df`` (the frame the index was built from)."""
+        positions = self.positions.get(client)
+        if positions is None and pd.isna(client):
+            # Another NaN object than the index key: look the missing entry up by value
+            positions = next((rows for key, rows in self.positions.items() if pd.isna(key)), None)
+        return df.iloc[positions if positions is not None else []]
+
+    def search(self, text):
+        """Clients whose name contains ``text`` (case-insensitive), in first-seen order."""
+        hits = np.char.find(self._search_labels, text.strip().casefold()) >= 0
+        return [self.clients[i] for i in np.flatnonzero(hits)]
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def client_index(version, _merged_df):
+    """The ``ClientIndex`` of ``_merged_df``, built once per dispatch ``version``."""
+    return ClientIndex(_merged_df["Client"])
+
+
+def pick_client(index, label="Choose Client", search_label="🔎 Search clients", key="client"):
+    """Search box plus selectbox over the clients of ``index``."""
+    query = st.text_input(search_label, key=f"{key}_search", placeholder=f"{len(index):,} clients")
+    options = index.search(query) if query.strip() else index.clients
+    if not options:
+        st.caption(f"No client matches “{query}”: showing all clients.")
+        options = index.clients
+    return st.selectbox(label, options, key=key)
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def group_keys(version, client_keys, _merged_df):
+    return dispatch_report.GroupKeys(_merged_df, client_keys)
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def summary(version, edits, _merged_df, client_keys=("Client",), vip_bonus=0, stock_label="Remaining_Stock",
+            _satisfaction_given=None):
+    """``dispatch_report.summarize`` once per dispatch ``version`` and set of manual ``edits``.
+
+    ``edits`` identifies the adjusted quantities, e.g. the selected client with
+    its ``To_Give`` values; it must also determine ``_satisfaction_given``.
+    The result is shared: do not modify its frames.
+    """
+    keys = group_keys(version, client_keys, _merged_df)
+    return dispatch_report.summarize(_merged_df, keys, client_keys, vip_bonus, stock_label, _satisfaction_given)
@@ -0,0 +1,244 @@
+"""Drop folder: Excel files saved in a local directory, merged incrementally.
+
+Each ``.xls``/``.xlsx`` file found in the folder is read once and stored as a
+Parquet part (columnar, fast to load and to select columns from) next to a
+SQLite manifest of the files' sizes, modification times and content hashes.
+A ``sync`` only stats the files: a file is hashed when its size or time
+changed, and read again only when its content did, so the cumulative dataset
+grows by the new files without re-reading the old ones. Parts are never
+rewritten; the part of a changed or deleted file is dropped. Parquet needs
+``pyarrow``: ``available()`` tells the UI whether to offer the folder.
+
+Only folders under ``ROOT`` (``APP_DROP_ROOT``, set on the server) can be
+watched: the UI offers the root and its subfolders, never a typed path.
+"""
+import hashlib
+import importlib.util
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+import excel_io
+from ref_store import DATA_DIR
+
+DEFAULT_DIR = os.environ.get("APP_DROP_DIR", os.path.join(DATA_DIR, "drop"))
+ROOT = os.path.realpath(os.environ.get("APP_DROP_ROOT", DEFAULT_DIR))
+STORE_DIR = os.path.join(DATA_DIR, "drop_store")
+EXTENSIONS = (".xls", ".xlsx")
+SOURCE_COL = "file name"
+
+
+def available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def folders(root=ROOT):
+    """The folders that can be watched: ``root`` and its subfolders, by name."""
+    if not os.path.isdir(root):
+        return [root]
+    with os.scandir(root) as entries:
+        subfolders = sorted(entry.path for entry in entries if entry.is_dir() and not entry.name.startswith("."))
+    return [root] + subfolders
+
+
+def resolve(folder, root=ROOT):
+    """``folder`` as a real path; ``ValueError`` unless it is ``root`` or under it."""
+    path = os.path.realpath(folder)
+    if os.path.commonpath([path, root]) != root:
+        raise ValueError(f"{folder} is outside the drop folder root {root}.")
+    return path
+
+
+def _file_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _write_part(df, path):
+    df = df.rename(columns=str)
+    try:
+        df.to_parquet(path, index=False)
+    except Exception:
+        # Columns mixing numbers and text: store those as text
+        mixed = {col: "string" for col in df.columns[df.dtypes == object]}
+        df.astype(mixed).to_parquet(path, index=False)
+
+
+class DropFolder:
+    def __init__(self, folder=DEFAULT_DIR, store_dir=STORE_DIR, root=ROOT):
+        self.folder = resolve(folder, root)
+        # One store per watched folder
+        self.store = os.path.join(store_dir, hashlib.sha1(self.folder.encode("utf-8")).hexdigest()[:12])
+        self.parts_dir = os.path.join(self.store, "parts")
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+                CREATE TABLE IF NOT EXISTS files (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    part TEXT,
+                    rows INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    ingested_at TEXT NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.store, "manifest.sqlite"), timeout=30)
+
+    @property
+    def version(self):
+        """Increases whenever the dataset changes."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def manifest(self):
+        """One row per file of the folder, by name."""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT name, size, rows, ingested_at, error FROM files ORDER BY name", conn
+            )
+
+    def _scan(self):
+        if not os.path.isdir(self.folder):
+            return {}
+        found = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(EXTENSIONS) and not entry.name.startswith("~$"):
+                    stat = entry.stat()
+                    found[entry.name] = (stat.st_size, stat.st_mtime)
+        return found
+
+    def sync(self, progress=None):
+        """Bring the dataset up to date with the folder; returns counts of added/changed/removed/failed files."""
+        with self.lock:
+            return self._sync(progress)
+
+    def _sync(self, progress):
+        found = self._scan()
+        with self._connect() as conn:
+            known = {row[0]: row[1:] for row in conn.execute("SELECT name, size, mtime, file_hash, part FROM files")}
+        # Same size and time: assume unchanged without reading the file
+        candidates = [name for name, stat in found.items() if known.get(name, (None, None))[:2] != stat]
+        removed = [name for name in known if name not in found]
+
+        hashes = {}
+
+        def changed_files():
+            for name in candidates:
+                try:
+                    with open(os.path.join(self.folder, name), "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                hashes[name] = _file_hash(data)
+                if name in known and known[name][2] == hashes[name]:
+                    continue
+                yield name, data
+
+        counts = {"added": 0, "changed": 0, "removed": len(removed), "failed": 0}
+        stale_parts = [known[name][3] for name in removed]
+        with self._connect() as conn:
+            for name, df, error in excel_io.read_many(changed_files(), progress=progress, total=len(candidates)):
+                part = None
+                if error is None:
+                    part = f"{uuid.uuid4().hex[:12]}.parquet"
+                    try:
+                        _write_part(df, os.path.join(self.parts_dir, part))
+                    except Exception as e:
+                        part, error = None, e
+                counts["failed" if error is not None else "changed" if name in known else "added"] += 1
+                if name in known:
+                    stale_parts.append(known[name][3])
+                size, mtime = found[name]
+                conn.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        name, size, mtime, hashes[name], part, 0 if df is None else len(df),
+                        None if error is None else f"{type(error).__name__}: {error}",
+                        datetime.now().isoformat(timespec="seconds")
+                    )
+                )
+            # Touched but identical files: only their size and time are new
+            for name in candidates:
+                if name in known and known[name][2] == hashes.get(name):
+                    conn.execute("UPDATE files SET size = ?, mtime = ? WHERE name = ?", (*found[name], name))
+            conn.executemany("DELETE FROM files WHERE name = ?", ((name,) for name in removed))
+            if counts["added"] or counts["changed"] or any(stale_parts):
+                conn.execute(
+                    "INSERT INTO meta VALUES ('version', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1"
+                )
+        for part in stale_parts:
+            if part:
+                try:
+                    os.remove(os.path.join(self.parts_dir, part))
+                except OSError:
+                    pass
+        return counts
+
+    def parts(self):
+        """Yield ``(file name, frame)`` for each stored file, by name."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, part FROM files WHERE part IS NOT NULL ORDER BY name").fetchall()
+        for name, part in rows:
+            path = os.path.join(self.parts_dir, part)
+            if os.path.exists(path):
+                yield name, pd.read_parquet(path)
+
+    def load(self):
+        """The cumulative dataset, with the source file name in ``SOURCE_COL``."""
+        frames = [df.assign(**{SOURCE_COL: name}) for name, df in self.parts()]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+@st.cache_resource
+def get_folder(folder):
+    """The server-wide ``DropFolder`` of ``folder``, shared by every session (one sync at a time)."""
+    return DropFolder(folder)
+
+
+def render_watcher(drop, every=10):
+    """Sync ``drop`` now and every ``every`` seconds; reruns the page when its dataset changed."""
+
+    @st.fragment(run_every=every)
+    def watcher():
+        version = drop.version
+        bar = None
+
+        def progress(done, total):
+            nonlocal bar
+            bar = bar or st.progress(0.0)
+            bar.progress(done / max(total, 1), text=f"Reading new files {done}/{total}")
+
+        counts = drop.sync(progress)
+        if bar is not None:
+            bar.empty()
+        manifest = drop.manifest()
+        failed = manifest[manifest["error"].notna()]
+        st.caption(
+            f"📂 `{drop.folder}`: {len(manifest) - len(failed):,} files, {int(manifest['rows'].sum()):,} rows"
+            + (f" · last sync: +{counts['added']} new, {counts['changed']} changed, {counts['removed']} removed"
+               if counts["added"] or counts["changed"] or counts["removed"] else "")
+        )
+        for name, error in failed[["name", "error"]].itertuples(index=False):
+            st.error(f"❌ Failed to read {name}: {error}")
+        if drop.version != version:
+            st.rerun()
+
+    watcher()
+
+
+@st.cache_resource(max_entries=2, show_spinner="Loading the drop folder dataset...")
+def dataset(folder, version):
+    """``DropFolder.load`` once per dataset ``version``. The frame is shared: work on a copy."""
+    return get_folder(folder).load()
@@ -0,0 +1,167 @@
+"""Reading uploaded workbooks: engine choice, and many files at once.
+
+``read_excel`` prefers the calamine engine (a Rust parser, several times
+faster than openpyxl) when ``python-calamine`` is installed, and falls back
+to pandas' default engine when it is missing or cannot read a workbook.
+Set ``APP_EXCEL_ENGINE`` to force an engine (e.g. ``openpyxl``).
+
+openpyxl and xlrd parse in pure Python and hold the GIL, so threads do not
+help: files are parsed in a pool of worker processes instead. Only a bounded
+number of files is in flight at a time, results come back in upload order, and
+a file that cannot be read is reported with its error instead of aborting the
+others. Files are passed as ``(name, bytes)`` pairs so they can be pickled to
+the workers. ``map_many`` runs any per-file work (e.g. writing slips) the
+same way.
+"""
+import importlib.util
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import pandas as pd
+
+ENGINE = os.environ.get("APP_EXCEL_ENGINE", "")
+WORKERS = int(os.environ.get("APP_READ_WORKERS", min(os.cpu_count() or 1, 8)))
+_pool = None
+# Script threads and background job threads share the pool: create and replace it under this lock
+_pool_lock = threading.Lock()
+
+
+def preferred_engine():
+    """``APP_EXCEL_ENGINE``, else calamine when installed, else ``None`` (pandas' default)."""
+    if ENGINE:
+        return ENGINE
+    return "calamine" if importlib.util.find_spec("python_calamine") else None
+
+
+def read_excel(source, **read_kwargs):
+    """``pd.read_excel`` with the fastest available engine (xlsx and xls alike)."""
+    engine = read_kwargs.pop("engine", None) or preferred_engine()
+    if engine is None:
+        return pd.read_excel(source, **read_kwargs)
+    try:
+        return pd.read_excel(source, engine=engine, **read_kwargs)
+    except Exception:
+        if engine != "calamine":
+            raise
+        # Retry with the default engine: the error, if any, then reads as usual
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return pd.read_excel(source, **read_kwargs)
+
+
+def read_excel_bytes(data, **read_kwargs):
+    return read_excel(BytesIO(data), **read_kwargs)
+
+
+def xls_to_xlsx(data):
+    """Convert a legacy ``.xls`` workbook (first sheet) to ``.xlsx`` bytes."""
+    output = BytesIO()
+    read_excel(BytesIO(data)).to_excel(output, index=False, engine="openpyxl")
+    return output.getvalue()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking the multi-threaded Streamlit server is unsafe (and unavailable on Windows)
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool(pool):
+    """Drop ``pool`` once it is broken, unless another thread already replaced it."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+# Script threads and background job threads share the pool: create and replace it under this lock
+_pool_lock = threading.Lock()
+
+
+def _call(func, name, payload, kwargs):
+    try:
+        return name, func(payload, **kwargs), None
+    except Exception as e:
+        return name, None, e
+
+
+def map_many(func, items, workers=WORKERS, max_in_flight=None, progress=None, total=None, **kwargs):
+    """Yield ``(name, func(payload, **kwargs), error)`` for each ``(name, payload)``, in order.
+
+    ``func`` runs in the worker processes (it must be a module-level function).
+    At most ``max_in_flight`` items (default twice the workers) are submitted
+    or waiting to be consumed, which bounds memory when the results are
+    consumed one by one; ``items`` may be a generator so that payloads are
+    only built as slots free up (pass ``total`` for the progress then).
+    ``progress(done, total)`` is called after each item. A single item, or
+    ``workers <= 1``, is handled in this process.
+    """
+    if total is None and hasattr(items, "__len__"):
+        total = len(items)
+    if workers <= 1 or total == 1:
+        for done, (name, payload) in enumerate(items, start=1):
+            yield _call(func, name, payload, kwargs)
+            if progress:
+                progress(done, total)
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    pending = iter(items)
+    in_flight = deque()
+    broken = False
+
+    def submit():
+        nonlocal broken
+        for name, payload in pending:
+            future = pool = None
+            if not broken:
+                pool = _get_pool()
+                try:
+                    future = pool.submit(func, payload, **kwargs)
+                except BrokenProcessPool:
+                    _reset_pool(pool)
+                    broken = True
+            in_flight.append((name, payload, future, pool))
+            return
+
+    for _ in range(max_in_flight):
+        submit()
+
+    done = 0
+    while in_flight:
+        # Waiting on the oldest item keeps the order; the others keep running meanwhile
+        name, payload, future, pool = in_flight.popleft()
+        if future is None:
+            result = _call(func, name, payload, kwargs)
+        else:
+            try:
+                result = (name, future.result(), None)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory): finish this batch here rather than fail it
+                if not broken:
+                    _reset_pool(pool)
+                    broken = True
+                result = _call(func, name, payload, kwargs)
+            except Exception as e:
+                result = (name, None, e)
+        submit()
+        done += 1
+        yield result
+        if progress:
+            progress(done, total)
+
+
+def read_many(files, reader=read_excel_bytes, workers=WORKERS, max_in_flight=None, progress=None, **read_kwargs):
+    """Yield ``(name, frame, error)`` for each ``(name, bytes)`` file, in the given order.
+
+    Files are parsed by ``reader(data, **read_kwargs)`` in the worker
+    processes; see ``map_many``.
+    """
+    return map_many(reader, files, workers, max_in_flight, progress, **read_kwargs)
@@ -0,0 +1,215 @@
+"""Background jobs for long matches, merges, conversions and exports.
+
+Jobs run in a thread pool owned by the Streamlit server process, so they keep
+going when the browser is refreshed or a widget reruns the page. Their state
+is kept in a SQLite table and finished outputs are written to disk, so any
+later run (or another session) can poll a job and download its result. Jobs
+left queued or running by a server process that has since stopped are marked
+interrupted.
+
+A job function receives a ``JobContext`` first and returns
+``(file_name, data)`` where ``data`` is bytes or a binary file object.
+"""
+import os
+import shutil
+import sqlite3
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from ref_store import DATA_DIR
+
+DB_PATH = os.path.join(DATA_DIR, "jobs.sqlite")
+OUTPUT_DIR = os.path.join(DATA_DIR, "jobs")
+WORKERS = int(os.environ.get("APP_JOB_WORKERS", 2))
+KEEP_DAYS = 7
+ACTIVE = ("queued", "running")
+STATUS_ICONS = {"queued": "⏳", "running": "⚙️", "done": "✅", "failed": "❌", "interrupted": "⚠️"}
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    if not pid or os.name == "nt":
+        # os.kill would terminate the process on Windows: treat it as gone
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobContext:
+    """Handed to job functions to report progress (written at most twice a second)."""
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+        self._last = 0.0
+
+    def progress(self, fraction, message=None):
+        now = time.monotonic()
+        if now - self._last < 0.5 and fraction < 1:
+            return
+        self._last = now
+        fields = {"progress": round(min(max(fraction, 0.0), 1.0), 4)}
+        if message is not None:
+            fields["message"] = message
+        self.runner._update(self.job_id, **fields)
+
+
+class JobRunner:
+    def __init__(self, path=DB_PATH, output_dir=OUTPUT_DIR, workers=WORKERS):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = path
+        self.output_dir = output_dir
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    error TEXT,
+                    output_name TEXT,
+                    pid INTEGER,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            # Jobs owned by a server process that is gone will never finish
+            stale = [
+                (_now(), row["id"]) for row in conn.execute("SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')")
+                if not _alive(row["pid"])
+            ]
+            conn.executemany("UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE id = ?", stale)
+        self.cleanup()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def submit(self, kind, title, func, *args, **kwargs):
+        """Queue ``func(context, *args, **kwargs)``; returns the job id."""
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, title, status, pid, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, title, os.getpid(), _now())
+            )
+        self.pool.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, func, args, kwargs):
+        self._update(job_id, status="running", started_at=_now())
+        try:
+            file_name, data = func(JobContext(self, job_id), *args, **kwargs)
+            job_dir = os.path.join(self.output_dir, job_id)
+            os.makedirs(job_dir, exist_ok=True)
+            with open(os.path.join(job_dir, file_name), "wb") as f:
+                if isinstance(data, bytes):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+            self._update(job_id, status="done", progress=1.0, output_name=file_name, message=None, finished_at=_now())
+        except Exception as e:
+            self._update(
+                job_id, status="failed", error=f"{type(e).__name__}: {e}",
+                message=traceback.format_exc(limit=5), finished_at=_now()
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, kinds=None, limit=20):
+        """Most recent jobs first, optionally only of the given ``kinds``."""
+        sql = "SELECT * FROM jobs"
+        params = []
+        if kinds:
+            sql += f" WHERE kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        sql += " ORDER BY created_at DESC, rowid DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def output_path(self, job):
+        return os.path.join(self.output_dir, job["id"], job["output_name"])
+
+    def delete(self, job_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ? AND status NOT IN ('queued', 'running')", (job_id,))
+        shutil.rmtree(os.path.join(self.output_dir, job_id), ignore_errors=True)
+
+    def cleanup(self, days=KEEP_DAYS):
+        """Forget finished jobs (and their outputs) older than ``days``."""
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec="seconds")
+        with self._connect() as conn:
+            old = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE created_at < ? AND status NOT IN ('queued', 'running')", (cutoff,)
+            )]
+        for job_id in old:
+            self.delete(job_id)
+
+
+@st.cache_resource
+def get_runner():
+    """The server-wide runner, shared by every session and page."""
+    return JobRunner()
+
+
+def render_jobs(kinds, key, limit=10):
+    """List recent jobs of ``kinds`` with progress and downloads; refreshes while any is active."""
+    runner = get_runner()
+    active = any(job["status"] in ACTIVE for job in runner.list(kinds, limit))
+
+    @st.fragment(run_every=2 if active else None)
+    def job_list():
+        jobs = runner.list(kinds, limit)
+        if not jobs:
+            return
+        st.subheader("🕒 Background jobs")
+        for job in jobs:
+            with st.container(border=True):
+                col1, col2 = st.columns([4, 1])
+                col1.markdown(f"{STATUS_ICONS.get(job['status'], '')} **{job['title']}** · {job['created_at'].replace('T', ' ')}")
+                if job["status"] in ACTIVE:
+                    col1.progress(job["progress"], text=job["message"] or job["status"].capitalize())
+                elif job["status"] == "done" and os.path.exists(runner.output_path(job)):
+                    with open(runner.output_path(job), "rb") as f:
+                        col2.download_button("📥 Download", f.read(), file_name=job["output_name"], key=f"{key}_get_{job['id']}")
+                elif job["status"] == "failed":
+                    col1.error(job["error"])
+                elif job["status"] == "interrupted":
+                    col1.warning("Interrupted by a server restart.")
+                if job["status"] not in ACTIVE and col2.button("🗑️", key=f"{key}_del_{job['id']}", help="Delete job"):
+                    runner.delete(job["id"])
+                    st.rerun()
+        if active and not any(job["status"] in ACTIVE for job in jobs):
+            # Stop polling once everything has finished
+            st.rerun()
+
+    job_list()
@@ -0,0 +1,341 @@
+"""Matching pipeline behind the Excel Matcher (tet.py).
+
+Search lists are full of repeated rows, so matching runs once per distinct
+tuple of search terms and remembers which original rows each tuple came from.
+Per-term hits are memoized: a term that appears in many tuples is only looked
+up in the database once, and a tuple's hits are the union of its terms' hits.
+"""
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from ref_index import TrigramIndex
+
+_NO_HITS = np.empty(0, dtype=np.intp)
+
+
+def dedup_term_rows(search_terms):
+    """Split ``{column: [term, ...]}`` into distinct term tuples.
+
+    Returns ``(unique_rows, occurrences)`` where ``occurrences[i]`` lists the
+    original row positions that carried ``unique_rows[i]``.
+    """
+    unique_rows = {}
+    occurrences = []
+    for pos, term_set in enumerate(zip(*search_terms.values())):
+        slot = unique_rows.setdefault(term_set, len(unique_rows))
+        if slot == len(occurrences):
+            occurrences.append([])
+        occurrences[slot].append(pos)
+    return list(unique_rows), occurrences
+
+
+class ExactMatcher:
+    """Case-sensitive substring matching over the selected database columns.
+
+    ``candidates`` is an optional callable returning the database index labels
+    that may contain a term (or ``None`` when it cannot tell); only those rows
+    are scanned.
+    """
+
+    def __init__(self, database_df, database_columns, candidates=None):
+        self.df = database_df[database_columns]
+        self.candidates = candidates
+        self._hits = {}
+
+    def term_hits(self, term):
+        if term not in self._hits:
+            self._hits[term] = self._scan(term)
+        return self._hits[term]
+
+    def _scan(self, term):
+        keys = self.candidates(term) if self.candidates else None
+        if keys is None:
+            positions = np.arange(len(self.df))
+            rows = self.df
+        else:
+            positions = np.flatnonzero(self.df.index.isin(list(keys)))
+            rows = self.df.iloc[positions]
+
+        mask = np.zeros(len(rows), dtype=bool)
+        for col in range(rows.shape[1]):
+            mask |= rows.iloc[:, col].str.contains(term, regex=False).to_numpy(dtype=bool)
+        return positions[mask]
+
+    def match(self, term_set):
+        """Return ``(row_positions, scores)`` for one tuple; scores are ``None``."""
+        hits = [self.term_hits(term) for term in term_set if term]
+        if not hits:
+            return _NO_HITS, None
+        return np.unique(np.concatenate(hits)), None
+
+
+class FuzzyMatcher:
+    """Normalized similarity matching through a ``ref_index.TrigramIndex``."""
+
+    def __init__(self, index, threshold):
+        self.index = index
+        self.threshold = threshold
+        self._hits = {}
+
+    def term_hits(self, term):
+        if term not in self._hits:
+            self._hits[term] = dict(self.index.search(term, threshold=self.threshold))
+        return self._hits[term]
+
+    def match(self, term_set):
+        """Return ``(row_positions, scores)`` keeping each row's best term score."""
+        best = {}
+        for term in term_set:
+            if not term:
+                continue
+            for pos, score in self.term_hits(term).items():
+                if score > best.get(pos, 0):
+                    best[pos] = score
+        if not best:
+            return _NO_HITS, np.empty(0)
+        positions = np.fromiter(best.keys(), dtype=np.intp, count=len(best))
+        scores = np.fromiter(best.values(), dtype=float, count=len(best))
+        return positions, scores
+
+
+class MatchAccumulator:
+    """Columnar store for matches: one (tuple, database row, score) triple each.
+
+    Matches cost a few bytes instead of a dict per hit. ``max_results`` caps the
+    total number of matches, ``per_term_limit`` the matches kept per term tuple
+    (the best scores first in fuzzy mode). With ``spill=True`` buffered matches
+    are flushed to raw files in a temporary directory every ``chunk_size``
+    matches and read back through memory maps.
+    """
+
+    _FIELDS = (("tuple_idx", np.int64), ("row_idx", np.int64), ("score", np.float32))
+
+    def __init__(self, max_results=None, per_term_limit=None, spill=False, chunk_size=1_000_000):
+        self.max_results = max_results or None
+        self.per_term_limit = per_term_limit or None
+        self.chunk_size = chunk_size
+        self.spill_dir = tempfile.mkdtemp(prefix="matcher_") if spill else None
+        self.truncated = False
+        self._buffers = {name: [] for name, _ in self._FIELDS}
+        self._buffered = 0
+        self._spilled = 0
+
+    def __len__(self):
+        return self._spilled + self._buffered
+
+    @property
+    def full(self):
+        return self.max_results is not None and len(self) >= self.max_results
+
+    def add(self, tuple_id, positions, scores=None):
+        if scores is not None and len(scores):
+            best_first = np.argsort(-scores, kind="stable")
+            positions, scores = positions[best_first], scores[best_first]
+
+        limit = len(positions)
+        if self.per_term_limit is not None:
+            limit = min(limit, self.per_term_limit)
+        if self.max_results is not None:
+            limit = min(limit, self.max_results - len(self))
+        if limit < len(positions):
+            self.truncated = True
+            positions = positions[:limit]
+            scores = scores[:limit] if scores is not None else None
+        if not len(positions):
+            return
+
+        self._buffers["tuple_idx"].append(np.full(len(positions), tuple_id, dtype=np.int64))
+        self._buffers["row_idx"].append(positions.astype(np.int64, copy=False))
+        self._buffers["score"].append(
+            scores.astype(np.float32, copy=False) if scores is not None else np.zeros(len(positions), dtype=np.float32)
+        )
+        self._buffered += len(positions)
+        if self.spill_dir and self._buffered >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        for name, dtype in self._FIELDS:
+            if self._buffers[name]:
+                with open(os.path.join(self.spill_dir, name), "ab") as f:
+                    f.write(np.concatenate(self._buffers[name]).astype(dtype, copy=False).tobytes())
+            self._buffers[name] = []
+        self._spilled += self._buffered
+        self._buffered = 0
+
+    def arrays(self):
+        """Return ``(tuple_idx, row_idx, scores)``; memory-mapped when spilled."""
+        if self.spill_dir:
+            self._flush()
+            if not self._spilled:
+                return tuple(np.empty(0, dtype=dtype) for _, dtype in self._FIELDS)
+            return tuple(
+                np.memmap(os.path.join(self.spill_dir, name), dtype=dtype, mode="r")
+                for name, dtype in self._FIELDS
+            )
+        return tuple(
+            np.concatenate(self._buffers[name]) if self._buffers[name] else np.empty(0, dtype=dtype)
+            for name, dtype in self._FIELDS
+        )
+
+    def close(self):
+        if self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+
+def sorted_order(unique_rows, categories, tuple_idx, scores=None):
+    """Order matches by searched reference (first appearance order), best score first.
+
+    ``categories`` holds, per search column, the distinct terms in the order
+    they appear in the search file.
+    """
+    keys = []
+    if scores is not None:
+        keys.append(-np.asarray(scores))
+    for col, terms in reversed(list(enumerate(categories))):
+        rank = {term: n for n, term in enumerate(terms)}
+        codes = np.array([rank[row[col]] for row in unique_rows], dtype=np.int64)
+        keys.append(codes[tuple_idx])
+    if not keys:
+        return np.arange(len(tuple_idx))
+    return np.lexsort(keys)
+
+
+def materialize(database_df, output_columns, refs, tuple_idx, row_idx, scores=None):
+    """Build the result frame from parallel (tuple, database row) index arrays.
+
+    ``refs`` is the frame of distinct search tuples, one row per tuple.
+    """
+    refs = refs.iloc[tuple_idx].reset_index(drop=True)
+    values = database_df[output_columns].iloc[row_idx].reset_index(drop=True)
+    result = pd.concat([refs, values], axis=1)
+    if scores is not None:
+        result['match_score'] = np.round(np.asarray(scores, dtype=float), 4)
+    return result
+
+
+class MatchPipeline:
+    """One matching run, from the search terms to the results workbook.
+
+    The Excel Matcher page drives the steps one by one (``match``, ``sort``,
+    ``write_excel``); background jobs call ``run``. ``search_terms`` maps each
+    search column to its list of terms. ``fuzzy_threshold=None`` selects exact
+    substring matching; fuzzy mode builds a trigram index unless ``index`` is
+    given. ``database_df`` must already be text (``astype(str).fillna('')``),
+    as the page prepares it. Duplicated search rows are matched once and, with
+    ``repeat_duplicates``, listed once per occurrence; ``max_results`` then caps
+    the output rows after that expansion.
+    """
+
+    def __init__(self, database_df, database_columns, output_columns, search_terms,
+                 fuzzy_threshold=None, index=None, candidates=None,
+                 max_results=None, per_term_limit=None, spill=False, repeat_duplicates=True):
+        self.database_df = database_df
+        self.output_columns = list(output_columns)
+        self.ref_columns = [f'searched_ref_{i+1}' for i in range(len(search_terms))]
+        self.categories = [list(dict.fromkeys(terms)) for terms in search_terms.values()]
+        self.fuzzy = fuzzy_threshold is not None
+        self.repeat_duplicates = repeat_duplicates
+
+        # Match each distinct tuple of terms once, expand duplicates at output time
+        self.unique_rows, self.occurrences = dedup_term_rows(search_terms)
+        self.refs = pd.DataFrame(self.unique_rows, columns=self.ref_columns)
+        if self.fuzzy:
+            if index is None:
+                index = TrigramIndex(self.database_df[database_columns].itertuples(index=False))
+            self.matcher = FuzzyMatcher(index, fuzzy_threshold)
+        else:
+            self.matcher = ExactMatcher(self.database_df, database_columns, candidates=candidates)
+        self.results = MatchAccumulator(max_results=max_results, per_term_limit=per_term_limit, spill=spill)
+        self.order = None
+
+    @property
+    def header(self):
+        return self.ref_columns + self.output_columns + (['match_score'] if self.fuzzy else [])
+
+    def match(self, progress=None):
+        """Match every distinct tuple; ``progress(fraction)`` is called after each one."""
+        for n, term_set in enumerate(self.unique_rows):
+            positions, scores = self.matcher.match(term_set)
+            self.results.add(n, positions, scores)
+            if progress:
+                progress((n + 1) / len(self.unique_rows))
+            if self.results.full:
+                break
+
+    def sort(self):
+        """Order the matches for output; returns positions into the match arrays."""
+        self.tuple_idx, self.row_idx, scores = self.results.arrays()
+        self.scores = scores if self.fuzzy else None
+        order = sorted_order(self.unique_rows, self.categories, self.tuple_idx, self.scores)
+        if self.repeat_duplicates:
+            repeats = np.array([len(pos) for pos in self.occurrences], dtype=np.intp)[self.tuple_idx[order]]
+            order = np.repeat(order, repeats)
+            cap = self.results.max_results
+            if cap is not None and len(order) > cap:
+                order = order[:cap]
+                self.results.truncated = True
+        self.order = order
+        return order
+
+    def frame(self, selection):
+        """Result rows for ``selection`` (positions from ``sort``)."""
+        # Output columns are only built for the slice being shown or written
+        return materialize(
+            self.database_df, self.output_columns, self.refs, self.tuple_idx[selection], self.row_idx[selection],
+            self.scores[selection] if self.scores is not None else None
+        )
+
+    def write_excel(self, sheet_name_base="Results", max_rows=1048575, block_size=50000, progress=None):
+        """Write the sorted results as xlsx, splitting sheets at Excel's row limit."""
+        output = BytesIO()
+        writer = pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}})
+        workbook = writer.book
+        searched_ref_format = workbook.add_format({'bold': True, 'font_color': 'blue'})
+        normal_format = workbook.add_format({'font_color': 'black'})
+        order = self.order
+        refs = len(self.ref_columns)
+
+        num_chunks = max(-(-len(order) // max_rows), 1)
+        for i in range(num_chunks):
+            worksheet = workbook.add_worksheet(f"{sheet_name_base}_{i + 1}")
+            for col_num, value in enumerate(self.header):
+                worksheet.write(0, col_num, value)
+
+            prev_searched_refs = [None] * refs
+            row_num = 1
+            for start in range(i * max_rows, min((i + 1) * max_rows, len(order)), block_size):
+                stop = min(start + block_size, (i + 1) * max_rows, len(order))
+                for row_data in self.frame(order[start:stop]).itertuples(index=False, name=None):
+                    for j in range(refs):
+                        if row_data[j] != prev_searched_refs[j]:
+                            worksheet.write(row_num, j, row_data[j], searched_ref_format)
+                            prev_searched_refs[j] = row_data[j]
+                        else:
+                            worksheet.write_blank(row_num, j, None, normal_format)
+                    for col_num, value in enumerate(row_data[refs:], start=refs):
+                        worksheet.write(row_num, col_num, value, normal_format)
+                    row_num += 1
+                if progress:
+                    progress(stop / len(order))
+        writer.close()
+        output.seek(0)
+        return output
+
+    def close(self):
+        self.results.close()
+
+    def run(self, progress=None):
+        """Match, sort and write in one go; ``progress`` gets ``(fraction, message)``."""
+        report = progress or (lambda fraction, message: None)
+        try:
+            self.match(lambda f: report(0.7 * f, "Matching"))
+            self.sort()
+            return self.write_excel(progress=lambda f: report(0.7 + 0.3 * f, "Writing workbook"))
+        finally:
+            self.close()
@@ -0,0 +1,251 @@
+"""Table operations shared by the Excel Tools tabs (merger.py)."""
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+
+def parse_source_codes(text):
+    """Turn ``"117, 226, 306"`` into ``[117, 226, 306]``; non-numeric codes stay text."""
+    codes = []
+    for part in text.split(','):
+        part = part.strip()
+        if part:
+            codes.append(int(part) if part.lstrip('-').isdigit() else part)
+    return codes
+
+
+def code_label(code):
+    if isinstance(code, float) and code.is_integer():
+        code = int(code)
+    return str(code)
+
+
+def to_nullable(frame):
+    """Cast numeric columns to ``Int64`` (or ``Float64``) so misses stay ``<NA>``."""
+    numeric = frame.apply(pd.to_numeric, errors="coerce")
+    if (numeric.notna() != frame.notna()).any().any():
+        # Some quantities are text: keep them as they are
+        return frame
+    values = numeric.to_numpy(dtype=float, na_value=np.nan)
+    if np.all(np.isnan(values) | (values == np.round(values))):
+        return numeric.astype("Int64")
+    return numeric.astype("Float64")
+
+
+def reference_matrix(df2, ref_col, source_col, qty_col, codes=None):
+    """Build the reference × source quantity matrix in a single pivot.
+
+    Like the row-by-row lookup, the first quantity found for a
+    (reference, source) pair wins. ``codes`` selects and orders the source
+    columns; when omitted every source code present in ``df2`` is used.
+    """
+    pairs = (
+        df2[[ref_col, source_col, qty_col]]
+        .dropna(subset=[ref_col, source_col])
+        .drop_duplicates([ref_col, source_col], keep="first")
+    )
+    matrix = pairs.pivot(index=ref_col, columns=source_col, values=qty_col)
+    if codes is not None:
+        matrix = matrix.reindex(columns=codes)
+    else:
+        try:
+            matrix = matrix.sort_index(axis=1)
+        except TypeError:
+            pass
+    matrix = to_nullable(matrix)
+    matrix.columns = [code_label(c) for c in matrix.columns]
+    return matrix
+
+
+def fill_matrix(df1, ref_col, matrix):
+    """Append the matrix columns to ``df1``, replacing columns with the same name."""
+    df1 = df1.drop(columns=[c for c in matrix.columns if c in df1.columns])
+    return df1.join(matrix, on=ref_col)
+
+
+def write_sparse_excel(df, sparse_columns, sheet_name="Sheet1"):
+    """Write ``df`` to xlsx, emitting only the non-empty cells of ``sparse_columns``.
+
+    The sparse columns must be the last columns of ``df``.
+    """
+    dense_columns = [c for c in df.columns if c not in sparse_columns]
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df[dense_columns].to_excel(writer, index=False, sheet_name=sheet_name)
+        # Header row only, with pandas' header styling
+        df[sparse_columns].iloc[:0].to_excel(writer, index=False, sheet_name=sheet_name, startcol=len(dense_columns))
+        worksheet = writer.sheets[sheet_name]
+
+        for offset, col in enumerate(sparse_columns, start=len(dense_columns)):
+            column = df[col].reset_index(drop=True).dropna()
+            for row, value in zip(column.index, column.tolist()):
+                worksheet.write(row + 1, offset, value)
+    output.seek(0)
+    return output
+
+
+AGG_FUNCS = [
+    "sum", "mean", "count", "max", "min", "nunique", "median",
+    "first", "last", "p25", "p75", "p90", "weighted mean",
+]
+TEXT_AGG_FUNCS = ["count", "nunique", "first", "last"]
+QUANTILES = {"p25": 0.25, "p75": 0.75, "p90": 0.9}
+PIVOT_SEPARATOR = " | "
+
+
+def agg_output_names(tasks):
+    """Column names for ``[(column, func), ...]``: plain when a column has one function."""
+    per_col = Counter(col for col, _ in tasks)
+    return [col if per_col[col] == 1 else f"{col} ({func})" for col, func in tasks]
+
+
+def _run_agg_tasks(values, keys, tasks, weights):
+    grouped = values.groupby(keys, sort=False)
+    results = []
+    for col, func in tasks:
+        if func in QUANTILES:
+            results.append(grouped[col].quantile(QUANTILES[func]))
+        elif func == "weighted mean":
+            x = pd.to_numeric(values[col], errors="coerce")
+            w = weights.where(x.notna())
+            results.append((x * w).groupby(keys).sum(min_count=1) / w.groupby(keys).sum(min_count=1))
+        else:
+            results.append(grouped[col].agg(func))
+    return results
+
+
+def group_aggregate(df, group_cols, tasks, weight_col=None, workers=None):
+    """Group ``df`` and apply every ``(column, func)`` task in one grouped pass.
+
+    Group keys are factorized once; the tasks are then split into blocks that
+    aggregate over the shared integer codes in parallel threads (pandas'
+    grouped kernels release the GIL). ``weight_col`` feeds "weighted mean".
+    """
+    grouper = df.groupby(group_cols, sort=True)
+    keys = grouper.ngroup()
+    index = grouper.size().index
+    valid = keys.notna().to_numpy()
+    codes = keys[valid].astype(np.int64).to_numpy()
+    columns = list(dict.fromkeys(col for col, _ in tasks))
+    values = df.loc[valid, columns].reset_index(drop=True)
+    weights = None
+    if weight_col is not None:
+        weights = pd.to_numeric(df.loc[valid, weight_col], errors="coerce").reset_index(drop=True)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    blocks = [tasks[n::workers] for n in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        block_results = list(pool.map(lambda block: _run_agg_tasks(values, codes, block, weights), blocks))
+
+    by_task = {}
+    for block, results in zip(blocks, block_results):
+        for task, result in zip(block, results):
+            by_task[task] = result.reindex(range(len(index))).to_numpy()
+
+    result = pd.DataFrame(
+        {name: by_task[task] for name, task in zip(agg_output_names(tasks), tasks)},
+        index=index,
+    )
+    return result.reset_index()
+
+
+def pivot_layout(grouped, row_cols, pivot_col, value_cols):
+    """Spread ``pivot_col`` values across columns: one column per (value, pivot value)."""
+    wide = grouped.set_index(row_cols + [pivot_col])[value_cols].unstack(pivot_col)
+    if len(value_cols) == 1:
+        wide.columns = [code_label(p) for _, p in wide.columns]
+    else:
+        wide.columns = [f"{v}{PIVOT_SEPARATOR}{code_label(p)}" for v, p in wide.columns]
+    return wide.reset_index()
+
+
+# Partial aggregates kept per group so files can be aggregated one at a time
+_PARTIALS = {
+    "sum": ("sum",),
+    "count": ("count",),
+    "min": ("min",),
+    "max": ("max",),
+    "mean": ("sum", "count"),
+}
+_COMBINE = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+STREAMING_AGG_FUNCS = list(_PARTIALS)
+
+
+class StreamingAggregator:
+    """Group & aggregate over many frames without concatenating them.
+
+    Each frame passed to ``add`` is reduced to per-group partials (sum, count,
+    min, max) which are folded into the running result, so memory grows with
+    the number of groups rather than the total number of rows. ``mean`` is
+    rebuilt from its sum and count; the other functions combine exactly.
+    ``tasks`` is a list of ``(column, func)`` pairs.
+    """
+
+    def __init__(self, group_cols, tasks):
+        unsupported = sorted({func for _, func in tasks} - set(_PARTIALS))
+        if unsupported:
+            raise ValueError(f"Streaming aggregation does not support: {', '.join(unsupported)}")
+        self.group_cols = list(group_cols)
+        self.tasks = list(tasks)
+        self.value_cols = list(dict.fromkeys(col for col, _ in self.tasks))
+        self.parts = {
+            f"{col}__{part}": (col, part)
+            for col, func in self.tasks
+            for part in _PARTIALS[func]
+        }
+        self.rows = 0
+        self._state = None
+
+    def add(self, df):
+        df = df.reindex(columns=list(dict.fromkeys(self.group_cols + self.value_cols)))
+        for col in self.value_cols:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        partial = df.groupby(self.group_cols).agg(**self.parts)
+        self.rows += len(df)
+
+        if self._state is None:
+            self._state = partial
+        else:
+            combine = {name: _COMBINE[part] for name, (_, part) in self.parts.items()}
+            self._state = pd.concat([self._state, partial]).groupby(level=self.group_cols).agg(combine)
+
+    def result(self):
+        names = agg_output_names(self.tasks)
+        if self._state is None:
+            return pd.DataFrame(columns=self.group_cols + names)
+        result = pd.DataFrame(index=self._state.index)
+        for name, (col, func) in zip(names, self.tasks):
+            if func == "mean":
+                result[name] = self._state[f"{col}__sum"] / self._state[f"{col}__count"].replace(0, np.nan)
+            else:
+                result[name] = self._state[f"{col}__{func}"]
+        return result.reset_index()
+
+
+def write_excel_pages(pages, sheet_name="Sheet1", preview_rows=1000):
+    """Write an iterable of DataFrame pages to one sheet as they arrive.
+
+    Returns ``(output, preview, total_rows)`` where ``preview`` holds the first
+    ``preview_rows`` rows.
+    """
+    output = BytesIO()
+    previews = []
+    total_rows = 0
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        for page in pages:
+            page.to_excel(
+                writer, index=False, sheet_name=sheet_name,
+                startrow=total_rows + 1 if total_rows else 0, header=not total_rows
+            )
+            if total_rows < preview_rows:
+                previews.append(page.head(preview_rows - total_rows))
+            total_rows += len(page)
+        if not previews:
+            pd.DataFrame().to_excel(writer, index=False, sheet_name=sheet_name)
+    output.seek(0)
+    preview = pd.concat(previews, ignore_index=True) if previews else pd.DataFrame()
+    return output, preview, total_rows
@@ -3,6 +3,17 @@ import pandas as pd
 import os
 from io import BytesIO
 import zipfile
+import dataset_registry
+import drop_folder
+import excel_io
+import jobs
+import perf
+import sql_backend
+from merge_ops import (
+    AGG_FUNCS, STREAMING_AGG_FUNCS, TEXT_AGG_FUNCS, StreamingAggregator, agg_output_names, code_label,
+    fill_matrix, group_aggregate, parse_source_codes, pivot_layout, reference_matrix, to_nullable,
+    write_excel_pages, write_sparse_excel
+)
 
 # --- Page Setup ---
 st.set_page_config(
@@ -11,8 +22,81 @@ st.set_page_config(
     layout="wide"
 )
 
+
+# --- Background jobs (files are passed as (name, bytes) pairs) ---
+def convert_job(job, files):
+    zip_buffer = BytesIO()
+    failed = []
+    converted = excel_io.read_many(
+        files, reader=excel_io.xls_to_xlsx, progress=lambda done, total: job.progress(done / total, f"Converted {done}/{total}")
+    )
+    with zipfile.ZipFile(zip_buffer, "w") as zipf:
+        for name, data, error in converted:
+            if error is None:
+                zipf.writestr(name.replace(".xls", ".xlsx"), data)
+            else:
+                failed.append(f"{name}: {error}")
+        if failed:
+            zipf.writestr("conversion_errors.txt", "\n".join(failed))
+    return "converted_xlsx_files.zip", zip_buffer.getvalue()
+
+
+def merge_job(job, files):
+    df_list = []
+    progress = lambda done, total: job.progress(0.8 * done / total, f"Read {done}/{total} files")
+    for name, df, error in excel_io.read_many(files, progress=progress):
+        if error is not None:
+            raise ValueError(f"Failed to read {name}: {error}")
+        df['file name'] = name
+        df_list.append(df)
+    job.progress(0.8, "Writing merged workbook")
+    output = BytesIO()
+    pd.concat(df_list, ignore_index=True).to_excel(output, index=False, engine='openpyxl')
+    return "merged_data.xlsx", output.getvalue()
+
+
+def match_merge_job(job, df1, df2, file1_ref_col, file2_ref_col, source_col, qty_col, codes):
+    job.progress(0, "Building reference matrix")
+    matrix = reference_matrix(df2, file2_ref_col, source_col, qty_col, codes)
+    df1 = fill_matrix(df1, file1_ref_col, matrix)
+    job.progress(0.5, "Writing workbook")
+    return "matched_result.xlsx", write_sparse_excel(df1, list(matrix.columns)).getvalue()
+
+
 st.image("prg.png", width=200)
 st.title("📊 Excel Tools")
+prof = perf.start_run("excel_tools")
+
+use_duckdb = sql_backend.available() and st.toggle(
+    "⚡ DuckDB engine",
+    value=False,
+    help="Run merge, match and pivot steps as parallel SQL queries in an embedded DuckDB database."
+)
+run_in_background = st.toggle(
+    "🕒 Background jobs",
+    value=False,
+    help="Run conversions, merges and matrix matches as background jobs that keep going if the page is refreshed."
+)
+drop = None
+if drop_folder.available() and st.toggle(
+    "📂 Drop folder",
+    value=False,
+    help="Merge and aggregate the Excel files saved in a local folder instead of uploads: each new or changed file is read once into a cumulative dataset."
+):
+    # Only folders under the server's drop root, and a store only once the user confirms the folder
+    choices = drop_folder.folders()
+    folder = st.selectbox(
+        "📂 Folder to watch", choices, key="drop_choice",
+        format_func=lambda path: os.path.relpath(path, drop_folder.ROOT) if path != drop_folder.ROOT else f"{path} (root)"
+    )
+    if st.button("📂 Watch this folder"):
+        st.session_state["drop_folder"] = folder
+    watched = st.session_state.get("drop_folder")
+    if watched in choices:
+        drop = drop_folder.get_folder(watched)
+        drop_folder.render_watcher(drop)
+    else:
+        st.caption("Pick a folder and click “Watch this folder” to start reading it.")
 
 # === Tabs ===
 tab3, tab1, tab2, tab4 = st.tabs([
@@ -28,24 +112,32 @@ with tab3:
     st.header("🛠 Convert `.xls` ➜ `.xlsx`")
     xls_files = st.file_uploader("📁 Upload `.xls` files (older Excel format)", type=["xls"], accept_multiple_files=True)
 
-    if xls_files:
+    if xls_files and run_in_background:
+        if st.button("🕒 Convert in background"):
+            jobs.get_runner().submit(
+                "convert", f"Convert {len(xls_files)} .xls files", convert_job,
+                [(f.name, f.getvalue()) for f in xls_files]
+            )
+            st.success("🕒 Conversion started in the background.")
+    elif xls_files:
         converted_files = []
-        for xls_file in xls_files:
-            try:
-                df = pd.read_excel(xls_file, engine="xlrd")
-                output = BytesIO()
-                df.to_excel(output, index=False, engine='openpyxl')
-                output.seek(0)
-                converted_files.append((xls_file.name.replace(".xls", ".xlsx"), output))
-                st.success(f"✅ Converted: {xls_file.name}")
-            except Exception as e:
-                st.error(f"❌ Failed to convert {xls_file.name}: {e}")
+        progress_bar = st.progress(0)
+        with prof.span("convert files"):
+            for name, data, error in excel_io.read_many(
+                [(f.name, f.getvalue()) for f in xls_files], reader=excel_io.xls_to_xlsx,
+                progress=lambda done, total: progress_bar.progress(done / total)
+            ):
+                if error is None:
+                    converted_files.append((name.replace(".xls", ".xlsx"), data))
+                    st.success(f"✅ Converted: {name}")
+                else:
+                    st.error(f"❌ Failed to convert {name}: {error}")
 
         if converted_files:
             zip_buffer = BytesIO()
             with zipfile.ZipFile(zip_buffer, "w") as zipf:
                 for filename, file_data in converted_files:
-                    zipf.writestr(filename, file_data.read())
+                    zipf.writestr(filename, file_data)
             zip_buffer.seek(0)
 
             st.download_button(
@@ -56,32 +148,63 @@ with tab3:
             )
     else:
         st.info("📌 Upload one or more `.xls` files to convert them to `.xlsx`.")
+    jobs.render_jobs(["convert"], key="convert_jobs")
 
 # === Tab 1: Merge ===
 with tab1:
     st.header("📦 Merge Multiple .xlsx Files")
-    uploaded_files = st.file_uploader("📁 Upload one or more Excel files (.xlsx)", type=["xlsx"], accept_multiple_files=True)
-
-    if uploaded_files:
+    uploaded_files = None if drop else st.file_uploader(
+        "📁 Upload one or more Excel files (.xlsx)", type=["xlsx"], accept_multiple_files=True
+    )
+
+    if uploaded_files and run_in_background:
+        if st.button("🕒 Merge in background"):
+            jobs.get_runner().submit(
+                "merge", f"Merge {len(uploaded_files)} files", merge_job,
+                [(f.name, f.getvalue()) for f in uploaded_files]
+            )
+            st.success("🕒 Merge started in the background.")
+    elif uploaded_files or drop:
         df_list = []
-        for uploaded_file in uploaded_files:
-            try:
-                df = pd.read_excel(uploaded_file)
-                df['file name'] = uploaded_file.name
-                df_list.append(df)
-            except Exception as e:
-                st.error(f"❌ Failed to read {uploaded_file.name}: {e}")
+        with prof.span("read files") as span:
+            if drop:
+                # Already merged on disk: the files are not read again
+                merged_drop = drop_folder.dataset(drop.folder, drop.version)
+                if not merged_drop.empty:
+                    df_list.append(merged_drop.copy(deep=False))
+            else:
+                progress_bar = st.progress(0)
+                results = dataset_registry.read_many(
+                    uploaded_files, progress=lambda done, total: progress_bar.progress(done / total)
+                )
+                for name, df, error in results:
+                    if error is None:
+                        df['file name'] = name
+                        df_list.append(df)
+                    else:
+                        st.error(f"❌ Failed to read {name}: {error}")
+            span["rows"] = sum(len(df) for df in df_list)
 
         if df_list:
-            merged_df = pd.concat(df_list, ignore_index=True)
-            st.success("✅ Files merged successfully!")
+            with prof.span("merge + export" if use_duckdb else "merge") as span:
+                if use_duckdb:
+                    with sql_backend.DuckDBBackend() as backend:
+                        tables = [backend.register(f"file_{n}", df) for n, df in enumerate(df_list)]
+                        output, merged_df, total_rows = write_excel_pages(backend.pages(backend.union_sql(tables)))
+                    st.success(f"✅ Files merged successfully! ({total_rows:,} rows)")
+                else:
+                    merged_df = pd.concat(df_list, ignore_index=True)
+                    st.success("✅ Files merged successfully!")
+                span["rows"] = total_rows if use_duckdb else len(merged_df)
 
             st.subheader("📋 Preview Merged Data")
             st.dataframe(merged_df, use_container_width=True)
 
-            output = BytesIO()
-            merged_df.to_excel(output, index=False, engine='openpyxl')
-            output.seek(0)
+            if not use_duckdb:
+                with prof.span("excel export", rows=len(merged_df)):
+                    output = BytesIO()
+                    merged_df.to_excel(output, index=False, engine='openpyxl')
+                    output.seek(0)
 
             st.download_button(
                 label="⬇️ Download Merged Excel",
@@ -93,17 +216,17 @@ with tab1:
             st.warning("⚠️ No valid data found in uploaded files.")
     else:
         st.info("📝 Please drag and drop `.xlsx` files to begin.")
+    jobs.render_jobs(["merge"], key="merge_jobs")
 
 # === Tab 2: Match & Merge ===
 with tab2:
     st.header("🔁 Match & Merge Two Files Based on Reference")
-    file1 = st.file_uploader("📁 Upload File 1 (Main Table) 'reference dispo'", type=["xlsx"], key="file1")
-    file2 = st.file_uploader("📁 Upload File 2 (Source Data)", type=["xlsx"], key="file2")
+    with prof.span("read files"):
+        df1 = dataset_registry.pick("📁 Upload File 1 (Main Table) 'reference dispo'", key="file1")
+        df2 = dataset_registry.pick("📁 Upload File 2 (Source Data)", key="file2")
 
-    if file1 and file2:
+    if df1 is not None and df2 is not None:
         try:
-            df1 = pd.read_excel(file1)
-            df2 = pd.read_excel(file2)
             st.success("✅ Files loaded successfully!")
 
             st.subheader("Step 1️⃣: Match Columns Between Files")
@@ -119,34 +242,71 @@ with tab2:
             file2_quantity_col = st.selectbox("🔢 Select 'Quantity' Column from File 2", df2.columns)
 
             st.subheader("Step 2️⃣: Define Target Headers for File 1")
-            source_cols_input = st.text_input(
+            matrix_mode = st.checkbox(
+                "📐 Matrix mode (single pivot, empty cells for misses)",
+                value=True,
+                help="Builds the reference × source table in one pass with nullable integer columns and skips empty cells when exporting."
+            )
+            auto_codes = matrix_mode and st.checkbox("🔎 Use every source code found in File 2", value=False)
+            source_cols_input = "" if auto_codes else st.text_input(
                 "📝 Enter source headers (comma-separated, e.g. 117,226,306):",
                 placeholder="117, 226, 306"
             )
 
-            if source_cols_input and st.button("🔄 Process and Merge"):
+            if matrix_mode and run_in_background and (source_cols_input or auto_codes):
+                if st.button("🕒 Process and Merge in background"):
+                    jobs.get_runner().submit(
+                        "match_merge", f"Match & merge {len(df1):,} references", match_merge_job,
+                        df1, df2, file1_ref_col, file2_ref_col, file2_source_col, file2_quantity_col,
+                        None if auto_codes else parse_source_codes(source_cols_input)
+                    )
+                    st.success("🕒 Match & merge started in the background.")
+            elif (source_cols_input or auto_codes) and st.button("🔄 Process and Merge"):
                 try:
-                    file1_source_cols = [col.strip() for col in source_cols_input.split(',')]
-
-                    for col in file1_source_cols:
-                        df1[col] = df1.apply(
-                            lambda row: df2.loc[
-                                (df2[file2_ref_col] == row[file1_ref_col]) &
-                                (df2[file2_source_col] == int(col)),
-                                file2_quantity_col
-                            ].values[0] if not df2.loc[
-                                (df2[file2_ref_col] == row[file1_ref_col]) &
-                                (df2[file2_source_col] == int(col))
-                            ].empty else '',
-                            axis=1
-                        )
+                    with prof.span("match & merge", rows=len(df1)):
+                        if matrix_mode:
+                            codes = None if auto_codes else parse_source_codes(source_cols_input)
+                            if use_duckdb:
+                                with sql_backend.DuckDBBackend() as backend:
+                                    backend.register("file1", df1)
+                                    backend.register("file2", df2)
+                                    if codes is None:
+                                        codes = backend.source_codes("file2", file2_source_col)
+                                    labels = {code: code_label(code) for code in codes}
+                                    sql, params = backend.reference_matrix_sql(
+                                        "file1", file1_ref_col, "file2", file2_ref_col,
+                                        file2_source_col, file2_quantity_col, labels
+                                    )
+                                    df1 = backend.fetch(sql, params)
+                                matrix_columns = list(labels.values())
+                                df1[matrix_columns] = to_nullable(df1[matrix_columns])
+                            else:
+                                matrix = reference_matrix(df2, file2_ref_col, file2_source_col, file2_quantity_col, codes)
+                                df1 = fill_matrix(df1, file1_ref_col, matrix)
+                                matrix_columns = list(matrix.columns)
+                            output = write_sparse_excel(df1, matrix_columns)
+                        else:
+                            file1_source_cols = [col.strip() for col in source_cols_input.split(',')]
+
+                            for col in file1_source_cols:
+                                df1[col] = df1.apply(
+                                    lambda row: df2.loc[
+                                        (df2[file2_ref_col] == row[file1_ref_col]) &
+                                        (df2[file2_source_col] == int(col)),
+                                        file2_quantity_col
+                                    ].values[0] if not df2.loc[
+                                        (df2[file2_ref_col] == row[file1_ref_col]) &
+                                        (df2[file2_source_col] == int(col))
+                                    ].empty else '',
+                                    axis=1
+                                )
+
+                            output = BytesIO()
+                            df1.to_excel(output, index=False, engine='openpyxl')
+                            output.seek(0)
 
                     st.success("✅ Data matched and merged successfully!")
 
-                    output = BytesIO()
-                    df1.to_excel(output, index=False, engine='openpyxl')
-                    output.seek(0)
-
                     st.subheader("📥 Download Result")
                     st.download_button(
                         label="⬇️ Download Filled Excel",
@@ -161,25 +321,47 @@ with tab2:
                 except Exception as e:
                     st.error(f"⚠️ Error during processing: {str(e)}")
         except Exception as e:
-            st.error(f"❌ Failed to read files: {str(e)}")
+            st.error(f"❌ Failed to process files: {str(e)}")
+    jobs.render_jobs(["match_merge"], key="match_merge_jobs")
 with tab4:
     st.header("📊 Pivot-style Merger (Group & Aggregate)")
 
-    pivot_files = st.file_uploader("📁 Upload Excel files to group and aggregate", type=["xlsx"], accept_multiple_files=True, key="pivot")
+    pivot_files = None if drop else st.file_uploader(
+        "📁 Upload Excel files to group and aggregate", type=["xlsx"], accept_multiple_files=True, key="pivot"
+    )
+    streaming_mode = st.checkbox(
+        "🌊 Streaming mode (aggregate one file at a time)",
+        value=False,
+        help="Only the first file is loaded for the preview; all files are then read and aggregated one by one, so memory depends on the number of groups, not on the total rows."
+    )
 
-    if pivot_files:
+    if pivot_files or drop:
         df_list = []
-        for f in pivot_files:
-            try:
-                df = pd.read_excel(f)
-                df['source_file'] = f.name
-                df_list.append(df)
-            except Exception as e:
-                st.error(f"❌ Error reading {f.name}: {e}")
+        with prof.span("read files") as span:
+            if drop and streaming_mode:
+                for name, df in drop.parts():
+                    df_list.append(df.assign(source_file=name))
+                    break
+            elif drop:
+                merged_drop = drop_folder.dataset(drop.folder, drop.version)
+                if not merged_drop.empty:
+                    df_list.append(merged_drop.rename(columns={drop_folder.SOURCE_COL: "source_file"}))
+            else:
+                for name, df, error in dataset_registry.read_many(pivot_files[:1] if streaming_mode else pivot_files):
+                    if error is None:
+                        df['source_file'] = name
+                        df_list.append(df)
+                    else:
+                        st.error(f"❌ Error reading {name}: {error}")
+            span["rows"] = sum(len(df) for df in df_list)
+        n_files = int(drop.manifest()["error"].isna().sum()) if drop else len(pivot_files)
 
         if df_list:
             merged = pd.concat(df_list, ignore_index=True)
-            st.success("✅ Files loaded and merged successfully.")
+            if streaming_mode:
+                st.success(f"✅ First file loaded; {n_files} files will be aggregated one at a time.")
+            else:
+                st.success("✅ Files loaded and merged successfully.")
             st.subheader("🔍 Preview of Combined Data")
             st.dataframe(merged.head(10), use_container_width=True)
 
@@ -187,27 +369,84 @@ with tab4:
             numeric_cols = merged.select_dtypes(include=['number']).columns.tolist()
 
             group_cols = st.multiselect("🔗 Group By Columns", all_columns)
-            agg_options = ["sum", "mean", "count", "max", "min"]
+            pivot_choice = st.selectbox(
+                "↔️ Spread a column across columns (pivot-table layout)",
+                ["(none)"] + [c for c in all_columns if c not in group_cols]
+            )
+            pivot_col = None if pivot_choice == "(none)" else pivot_choice
 
-            agg_config = {}
+            tasks = []
             st.subheader("🔣 Choose Aggregations")
 
-            for col in numeric_cols:
-                agg_choice = st.selectbox(f"📌 Aggregate `{col}` by:", ["(skip)"] + agg_options, key=col)
-                if agg_choice != "(skip)":
-                    agg_config[col] = agg_choice
-
-            if group_cols and agg_config and st.button("🔄 Run Aggregation"):
+            for col in all_columns:
+                if col in group_cols or col == pivot_col:
+                    continue
+                if streaming_mode:
+                    if col not in numeric_cols:
+                        continue
+                    col_options = STREAMING_AGG_FUNCS
+                else:
+                    col_options = AGG_FUNCS if col in numeric_cols else TEXT_AGG_FUNCS
+                agg_choices = st.multiselect(f"📌 Aggregate `{col}` by:", col_options, key=f"agg_{col}")
+                tasks.extend((col, func) for func in agg_choices)
+
+            weight_col = None
+            if any(func == "weighted mean" for _, func in tasks):
+                weight_col = st.selectbox("⚖️ Weight column for weighted means", numeric_cols)
+
+            if group_cols and tasks and st.button("🔄 Run Aggregation"):
                 try:
-                    grouped = merged.groupby(group_cols).agg(agg_config).reset_index()
+                    with prof.span("aggregate") as span:
+                        keys = group_cols + ([pivot_col] if pivot_col else [])
+                        value_names = agg_output_names(tasks)
+                        output = None
+                        if streaming_mode:
+                            aggregator = StreamingAggregator(keys, tasks)
+                            progress_bar = st.progress(0)
+                            if drop:
+                                # Stored parts: read back one at a time, no Excel parsing
+                                files = ((name, df, None) for name, df in drop.parts())
+                            else:
+                                # Files are parsed ahead in parallel, but only a few are held at once
+                                files = excel_io.read_many(
+                                    [(f.name, f.getvalue()) for f in pivot_files],
+                                    progress=lambda done, total: progress_bar.progress(done / total)
+                                )
+                            for name, df, error in files:
+                                if error is None:
+                                    df['source_file'] = name
+                                    aggregator.add(df)
+                                else:
+                                    st.error(f"❌ Error reading {name}: {error}")
+                            grouped = aggregator.result()
+                            st.caption(f"{aggregator.rows:,} rows aggregated into {len(grouped):,} groups.")
+                        elif use_duckdb:
+                            with sql_backend.DuckDBBackend() as backend:
+                                tables = [backend.register(f"file_{n}", df) for n, df in enumerate(df_list)]
+                                sql = backend.group_aggregate_sql(
+                                    backend.union_sql(tables, order_column=True), keys, tasks, value_names, weight_col
+                                )
+                                if pivot_col:
+                                    grouped = backend.fetch(sql)
+                                else:
+                                    output, grouped, total_rows = write_excel_pages(backend.pages(sql), preview_rows=10_000)
+                                    st.caption(f"{total_rows:,} groups (preview limited to the first 10,000).")
+                        else:
+                            grouped = group_aggregate(merged, keys, tasks, weight_col=weight_col)
+
+                        if pivot_col:
+                            grouped = pivot_layout(grouped, group_cols, pivot_col, value_names)
+                        span["rows"] = len(grouped)
                     st.success("✅ Aggregation completed!")
 
                     st.subheader("📋 Aggregated Result")
                     st.dataframe(grouped, use_container_width=True)
 
-                    output = BytesIO()
-                    grouped.to_excel(output, index=False, engine='openpyxl')
-                    output.seek(0)
+                    with prof.span("excel export", rows=len(grouped)):
+                        if output is None:
+                            output = BytesIO()
+                            grouped.to_excel(output, index=False, engine='openpyxl')
+                            output.seek(0)
 
                     st.download_button(
                         label="⬇️ Download Aggregated Excel",
@@ -220,4 +459,6 @@ with tab4:
             else:
                 st.info("ℹ️ Please select group and aggregation columns.")
     else:
-        st.info("📂 Upload `.xlsx` files to begin.")
\ No newline at end of file
+        st.info("📂 Upload `.xlsx` files to begin.")
+
+perf.render_panel(prof, "excel_tools")
@@ -1,8 +1,7 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
+import dispatch_report
 
 st.set_page_config(page_title="Client Dispatch Assistant", layout="wide")
 st.title("📦 Client Dispatch and Satisfaction Dashboard")
@@ -115,13 +114,17 @@ if orders_file and stock_file:
         st.subheader("📊 Client Satisfaction Overview")
         satisfaction_by_client = merged_df.groupby("Client")["Satisfaction (%)"].mean().reset_index()
 
-        fig, ax = plt.subplots(figsize=(12, 6))
+        # Plotting libraries are only loaded once there is something to plot
+        import seaborn as sns
+
+        fig = dispatch_report.figure(figsize=(12, 6))
+        ax = fig.subplots()
         bars = sns.barplot(data=satisfaction_by_client, x="Client", y="Satisfaction (%)", palette="coolwarm", ax=ax)
         ax.set_ylim(0, 110)
         ax.set_title("Client Satisfaction (%)")
         ax.set_ylabel("Satisfaction (%)")
         ax.set_xlabel("Client")
-        plt.xticks(rotation=45)
+        ax.tick_params(axis="x", labelrotation=45)
 
         for p in bars.patches:
             height = p.get_height()
@@ -129,7 +132,6 @@ if orders_file and stock_file:
                           ha='center', fontsize=9, color='black')
 
         st.pyplot(fig)
-        plt.close(fig)
 
         # 🥧 Fulfillment Pie Chart
         st.subheader("🥧 Overall Fulfillment")
@@ -138,7 +140,8 @@ if orders_file and stock_file:
         fulfilled = total_given
         unfulfilled = max(0, total_ordered - total_given)
 
-        pie_fig, pie_ax = plt.subplots()
+        pie_fig = dispatch_report.figure()
+        pie_ax = pie_fig.subplots()
         pie_ax.pie(
             [fulfilled, unfulfilled],
             labels=["Fulfilled", "Unfulfilled"],
@@ -150,7 +153,6 @@ if orders_file and stock_file:
         pie_ax.axis("equal")
         pie_ax.set_title("Total Order Fulfillment")
         st.pyplot(pie_fig)
-        plt.close(pie_fig)
 
         # 🧾 Audit Stock & Demand
         st.subheader("🧮 Stock vs Demand Audit")
@@ -1,8 +1,7 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
+import dispatch_report
 
 st.set_page_config(page_title="Client Dispatch Assistant", layout="wide")
 st.title("📦 Client Dispatch and Satisfaction Dashboard")
@@ -118,14 +117,18 @@ if orders_file and stock_file:
         # 📊 Client Satisfaction Overview
         st.subheader("📊 Client Satisfaction Breakdown")
 
-        fig, ax = plt.subplots(figsize=(12, 6))
+        # Plotting libraries are only loaded once there is something to plot
+        import seaborn as sns
+
+        fig = dispatch_report.figure(figsize=(12, 6))
+        ax = fig.subplots()
         satisfaction = merged_df.groupby("Client")["Satisfaction (%)"].mean().reset_index()
         bars = sns.barplot(data=satisfaction, x="Client", y="Satisfaction (%)", palette="coolwarm", ax=ax)
         ax.set_ylim(0, 110)
         ax.set_title("Average Satisfaction per Client", fontsize=16)
         ax.set_ylabel("Satisfaction (%)")
         ax.set_xlabel("Client")
-        plt.xticks(rotation=45)
+        ax.tick_params(axis="x", labelrotation=45)
 
         for p in bars.patches:
             height = p.get_height()
@@ -10,9 +10,10 @@ st.set_page_config(
 # Other imports
 from streamlit_option_menu import option_menu
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
+import dataset_registry
+import dispatch_report
+import dispatch_view
+import perf
 
 # Show logo
 st.image("prg.png", width=250)
@@ -24,6 +25,8 @@ translations = {
         "upload_orders": "Upload Orders File",
         "upload_stock": "Upload Stock File",
         "choose_client": "Choose Client",
+        "strategy": "⚖️ Allocation Strategy",
+        "search_clients": "🔎 Search clients",
         "edit_quantities": "✍️ Adjust Quantities for a Client",
         "dispatch_summary": "📋 Dispatch Summary",
         "satisfaction_chart": "📊 Client Satisfaction Overview",
@@ -39,6 +42,8 @@ translations = {
         "upload_orders": "Télécharger le fichier de commandes",
         "upload_stock": "Télécharger le fichier de stock",
         "choose_client": "Choisir le client",
+        "strategy": "⚖️ Stratégie d'allocation",
+        "search_clients": "🔎 Rechercher un client",
         "edit_quantities": "✍️ Ajuster les quantités pour un client",
         "dispatch_summary": "📋 Résumé de la répartition",
         "satisfaction_chart": "📊 Vue de satisfaction client",
@@ -57,6 +62,7 @@ lang_code = "en" if "English" in lang else "fr"
 T = translations[lang_code]
 
 st.title(T["title"])
+prof = perf.start_run("dispatch")
 
 # Upload
 st.sidebar.header("📁 Upload Files")
@@ -65,8 +71,10 @@ stock_file = st.sidebar.file_uploader(T["upload_stock"], type=["xlsx"])
 
 if orders_file and stock_file:
     try:
-        orders_df = pd.read_excel(orders_file)
-        stock_df = pd.read_excel(stock_file)
+        with prof.span("read files") as span:
+            orders_df = dataset_registry.read_excel(orders_file)
+            stock_df = dataset_registry.read_excel(stock_file)
+            span["rows"] = len(orders_df) + len(stock_df)
         st.success(T["success"])
 
         # Column mapping
@@ -79,6 +87,13 @@ if orders_file and stock_file:
         qty_ordered_col = st.sidebar.selectbox("Ordered Quantity Column", orders_columns)
         stock_product_col = st.sidebar.selectbox("Product Column (Stock)", stock_columns)
         stock_qty_col = st.sidebar.selectbox("Stock Quantity Column", stock_columns)
+        strategy, params = dispatch_view.pick_strategy("proportional", orders_columns, vip=False, label=T["strategy"])
+
+        # Same allocation and parameters, files and mapping: same dispatch (cache key for the allocation, client index and KPIs)
+        version = (
+            strategy, dataset_registry.file_key(orders_file), dataset_registry.file_key(stock_file),
+            product_col, client_col, qty_ordered_col, stock_product_col, stock_qty_col, tuple(sorted(params.items()))
+        )
 
         # Rename
         orders_df = orders_df.rename(columns={
@@ -92,46 +107,24 @@ if orders_file and stock_file:
         })
 
         # Merge
-        merged_df = orders_df.merge(stock_df, on="Product", how="left")
-        merged_df["Available_Qty"] = pd.to_numeric(merged_df["Available_Qty"], errors="coerce").fillna(0)
-        merged_df["Ordered_Qty"] = pd.to_numeric(merged_df["Ordered_Qty"], errors="coerce").fillna(0)
+        with prof.span("merge") as span:
+            merged_df = orders_df.merge(stock_df, on="Product", how="left")
+            merged_df["Available_Qty"] = pd.to_numeric(merged_df["Available_Qty"], errors="coerce").fillna(0)
+            merged_df["Ordered_Qty"] = pd.to_numeric(merged_df["Ordered_Qty"], errors="coerce").fillna(0)
+            span["rows"] = len(merged_df)
 
         # Auto Dispatch Calculation
-        merged_df["Auto_Dispatch_Qty"] = 0
-        for product, group in merged_df.groupby("Product"):
-            total_ordered = group["Ordered_Qty"].sum()
-            stock_row = stock_df[stock_df["Product"] == product]
-            total_stock = stock_row["Available_Qty"].sum() if not stock_row.empty else 0
-
-            if total_ordered == 0 or total_stock == 0:
-                merged_df.loc[group.index, "Auto_Dispatch_Qty"] = 0
-                continue
-
-            allocations = []
-            for _, row in group.iterrows():
-                prop = (row["Ordered_Qty"] / total_ordered) * total_stock
-                to_give = min(row["Ordered_Qty"], int(round(prop)))
-                allocations.append(to_give)
-
-            # Adjustment loop
-            total_allocated = sum(allocations)
-            while total_allocated > total_stock:
-                for i in range(len(allocations)):
-                    if allocations[i] > 0:
-                        allocations[i] -= 1
-                        total_allocated -= 1
-                        if total_allocated <= total_stock:
-                            break
-
-            merged_df.loc[group.index, "Auto_Dispatch_Qty"] = allocations
+        with prof.span("allocation", rows=len(merged_df)):
+            dispatch_view.allocate(version, merged_df, stock_df, **params)
 
         # Set editable column
         merged_df["To_Give"] = merged_df["Auto_Dispatch_Qty"]
 
         # Client selector
         st.subheader(T["edit_quantities"])
-        selected_client = st.selectbox(T["choose_client"], merged_df["Client"].unique())
-        client_data = merged_df[merged_df["Client"] == selected_client].copy()
+        clients = dispatch_view.client_index(version, merged_df)
+        selected_client = dispatch_view.pick_client(clients, T["choose_client"], T["search_clients"])
+        client_data = clients.rows(merged_df, selected_client).copy()
 
         st.markdown("### ✨ You can adjust 'To_Give'. Cannot exceed ordered quantity.")
 
@@ -149,63 +142,63 @@ if orders_file and stock_file:
             updated_val = min(row["To_Give"], max_allowed)
             merged_df.at[client_data.index[i], "To_Give"] = updated_val
 
-        # Satisfaction calculation
-        merged_df["Satisfaction (%)"] = round((merged_df["To_Give"] / merged_df["Ordered_Qty"]) * 100, 2).fillna(0)
+        # Satisfaction, client and stock KPIs (computed once per dispatch and set of edits)
+        edits = (selected_client, tuple(clients.rows(merged_df, selected_client)["To_Give"]))
+        with prof.span("summary", rows=len(merged_df)):
+            summary = dispatch_view.summary(version, edits, merged_df)
+        merged_df["Satisfaction (%)"] = summary.satisfaction
 
         st.subheader(T["dispatch_summary"])
         st.dataframe(merged_df)
 
         # Satisfaction Chart
         st.subheader(T["satisfaction_chart"])
-        satisfaction_by_client = merged_df.groupby("Client")["Satisfaction (%)"].mean().reset_index()
-
-        fig, ax = plt.subplots(figsize=(10, 5))
-        sns.barplot(data=satisfaction_by_client, x="Client", y="Satisfaction (%)", palette="viridis", ax=ax)
-        ax.set_ylim(0, 110)
-        ax.set_title("Client Satisfaction (%)")
-        ax.set_xlabel("Client")
-        ax.set_ylabel("Satisfaction (%)")
-        for bar in ax.patches:
-            ax.annotate(f'{bar.get_height():.1f}%', (bar.get_x() + bar.get_width() / 2, bar.get_height() + 1),
-                        ha='center')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        satisfaction_by_client = summary.clients
+
+        with prof.span("satisfaction chart", rows=len(satisfaction_by_client)):
+            # Plotting libraries are only loaded once there is something to plot
+            import seaborn as sns
+
+            fig = dispatch_report.figure(figsize=(10, 5))
+            ax = fig.subplots()
+            sns.barplot(data=satisfaction_by_client, x="Client", y="Satisfaction (%)", palette="viridis", ax=ax)
+            ax.set_ylim(0, 110)
+            ax.set_title("Client Satisfaction (%)")
+            ax.set_xlabel("Client")
+            ax.set_ylabel("Satisfaction (%)")
+            for bar in ax.patches:
+                ax.annotate(f'{bar.get_height():.1f}%', (bar.get_x() + bar.get_width() / 2, bar.get_height() + 1),
+                            ha='center')
+            ax.tick_params(axis="x", labelrotation=45)
+            st.pyplot(fig)
 
         # Fulfillment Pie Chart
         st.subheader(T["fulfillment_pie"])
-        total_ordered = merged_df["Ordered_Qty"].sum()
-        total_given = merged_df["To_Give"].sum()
-        fig2, ax2 = plt.subplots()
-        ax2.pie(
-            [total_given, total_ordered - total_given],
-            labels=["Fulfilled", "Unfulfilled"],
-            colors=["#2ecc71", "#e74c3c"],
-            autopct="%1.1f%%",
-            startangle=90,
-            wedgeprops={'edgecolor': 'white'}
-        )
-        ax2.axis("equal")
-        st.pyplot(fig2)
+        with prof.span("fulfillment chart"):
+            fig2 = dispatch_report.figure()
+            ax2 = fig2.subplots()
+            ax2.pie(
+                summary.fulfillment,
+                labels=["Fulfilled", "Unfulfilled"],
+                colors=["#2ecc71", "#e74c3c"],
+                autopct="%1.1f%%",
+                startangle=90,
+                wedgeprops={'edgecolor': 'white'}
+            )
+            ax2.axis("equal")
+            st.pyplot(fig2)
 
         # Stock Audit
         st.subheader(T["audit"])
-        audit = merged_df.groupby("Product").agg({
-            "Ordered_Qty": "sum",
-            "To_Give": "sum",
-            "Available_Qty": "first"
-        }).reset_index()
-        audit["Remaining_Stock"] = audit["Available_Qty"] - audit["To_Give"]
-        audit["Unmet_Demand"] = audit["Ordered_Qty"] - audit["To_Give"]
-        st.dataframe(audit)
+        st.dataframe(summary.products)
 
         # Download report
         st.subheader(T["download_report"])
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            merged_df.to_excel(writer, sheet_name="Dispatch", index=False)
+        with prof.span("excel export", rows=len(merged_df)):
+            output = dispatch_report.to_excel(merged_df)
         st.download_button(
             label="📥 Download Dispatch Report",
-            data=output.getvalue(),
+            data=output,
             file_name="dispatch_report.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -214,3 +207,5 @@ if orders_file and stock_file:
         st.error(f"{T['error']}: {e}")
 else:
     st.warning(T["warning"])
+
+perf.render_panel(prof, "dispatch")
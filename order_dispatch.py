@@ -1,9 +1,10 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
 import numpy as np
+import dataset_registry
+import dispatch_report
+import dispatch_view
+import perf
 
 # 🧷 Page Configuration
 st.set_page_config(
@@ -14,17 +15,18 @@ st.set_page_config(
 
 # 🖼️ Logo
 st.image("prg.png", width=250)
+prof = perf.start_run("order_dispatch")
 
 # 📁 File Upload
 st.sidebar.header("📁 Upload Files")
-orders_file = st.sidebar.file_uploader("Upload Orders File", type=["xlsx"])
-stock_file = st.sidebar.file_uploader("Upload Stock File", type=["xlsx"])
+with prof.span("read files"):
+    orders_key = dataset_registry.pick_key("Upload Orders File", key="orders", container=st.sidebar)
+    stock_key = dataset_registry.pick_key("Upload Stock File", key="stock", container=st.sidebar)
 
-if orders_file and stock_file:
+if orders_key is not None and stock_key is not None:
     try:
-        orders_df = pd.read_excel(orders_file)
-        stock_df = pd.read_excel(stock_file)
-
+        orders_df = dataset_registry.registry().get(orders_key)
+        stock_df = dataset_registry.registry().get(stock_key)
         st.success("✅ Files loaded successfully!")
 
         # Column Mapping
@@ -38,6 +40,13 @@ if orders_file and stock_file:
         vip_col = st.sidebar.selectbox("VIP Column (1=VIP, 0=Not)", orders_columns)
         stock_product_col = st.sidebar.selectbox("Product Column (Stock)", stock_columns)
         stock_qty_col = st.sidebar.selectbox("Stock Quantity Column", stock_columns)
+        strategy, params = dispatch_view.pick_strategy("proportional_vip", orders_columns)
+
+        # Same allocation and parameters, files and mapping: same dispatch (cache key for the allocation, client index and KPIs)
+        version = (
+            strategy, orders_key, stock_key, product_col, client_col, qty_ordered_col, vip_col, stock_product_col, stock_qty_col,
+            tuple(sorted(params.items()))
+        )
 
         # Rename Columns
         orders_df = orders_df.rename(columns={
@@ -57,56 +66,24 @@ if orders_file and stock_file:
         stock_df["Available_Qty"] = pd.to_numeric(stock_df["Available_Qty"], errors="coerce").fillna(0)
 
         # Merge Orders + Stock
-        merged_df = orders_df.merge(stock_df, on="Product", how="left")
-        merged_df["Available_Qty"] = merged_df["Available_Qty"].fillna(0)
+        with prof.span("merge") as span:
+            merged_df = orders_df.merge(stock_df, on="Product", how="left")
+            merged_df["Available_Qty"] = merged_df["Available_Qty"].fillna(0)
+            span["rows"] = len(merged_df)
 
         # Initialize dispatch column
-        merged_df["Auto_Dispatch_Qty"] = 0
-
-        # 🚚 Dispatch Calculation with VIP priority
-        for product, group in merged_df.groupby("Product"):
-            stock_qty = stock_df.loc[stock_df["Product"] == product, "Available_Qty"].sum()
-            if stock_qty == 0:
-                continue
-
-            vip_group = group[group["VIP"] == 1].copy()
-            regular_group = group[group["VIP"] == 0].copy()
-
-            def allocate(group, stock_left, vip_boost=0):
-                total_ordered = group["Ordered_Qty"].sum()
-                if total_ordered == 0 or stock_left == 0:
-                    return [0] * len(group), 0
-
-                alloc = []
-                for _, row in group.iterrows():
-                    proportional = (row["Ordered_Qty"] / total_ordered) * stock_left
-                    to_give = min(row["Ordered_Qty"], int(round(proportional))) + vip_boost
-                    alloc.append(to_give)
-
-                # Adjust if overallocated
-                while sum(alloc) > stock_left:
-                    for i in range(len(alloc)):
-                        if alloc[i] > 0:
-                            alloc[i] -= 1
-                            if sum(alloc) <= stock_left:
-                                break
-                return alloc, sum(alloc)
-
-            # Boost for VIP clients to increase their To_Give priority
-            vip_alloc, vip_sum = allocate(vip_group, stock_qty, vip_boost=5)
-            stock_left = stock_qty - vip_sum
-            reg_alloc, _ = allocate(regular_group, stock_left)
-
-            merged_df.loc[vip_group.index, "Auto_Dispatch_Qty"] = vip_alloc
-            merged_df.loc[regular_group.index, "Auto_Dispatch_Qty"] = reg_alloc
+        with prof.span("allocation", rows=len(merged_df)):
+            # 🚚 Dispatch Calculation with VIP priority (by default VIP lines get a +5 boost)
+            dispatch_view.allocate(version, merged_df, stock_df, **params)
 
         # Create To_Give for manual adjustment
         merged_df["To_Give"] = merged_df["Auto_Dispatch_Qty"]
 
         # ✍️ Client Adjustment UI
         st.subheader("✍️ Adjust Quantities for a Client")
-        selected_client = st.selectbox("Choose Client", merged_df["Client"].unique())
-        client_data = merged_df[merged_df["Client"] == selected_client].copy()
+        clients = dispatch_view.client_index(version, merged_df)
+        selected_client = dispatch_view.pick_client(clients)
+        client_data = clients.rows(merged_df, selected_client).copy()
 
         st.markdown("### You can edit ‘To_Give’. Cannot exceed Ordered Quantity.")
 
@@ -128,66 +105,68 @@ if orders_file and stock_file:
             idx = client_data.index[i]
             merged_df.at[idx, "To_Give"] = row["To_Give"]
 
-        # 💯 Satisfaction (Boosted for VIPs)
-        merged_df["Satisfaction (%)"] = round((merged_df["To_Give"] / merged_df["Ordered_Qty"]) * 100, 2).fillna(0)
+        # 💯 Satisfaction (Boosted for VIPs) is measured on the quantities before the clamp below
+        edits = (selected_client, tuple(clients.rows(merged_df, selected_client)["To_Give"]))
+        requested = merged_df["To_Give"].to_numpy(copy=True)
 
-        # Ensure To_Give does not exceed Ordered_Qty
-        merged_df["To_Give"] = merged_df.apply(lambda row: min(row["To_Give"], row["Ordered_Qty"]), axis=1)
+        # Ensure To_Give does not exceed Ordered_Qty (the VIP boost can go over)
+        merged_df["To_Give"] = np.minimum(merged_df["To_Give"], merged_df["Ordered_Qty"])
 
-        # Increase Satisfaction for VIPs
-        merged_df["Satisfaction (%)"] = np.where(merged_df["VIP"] == 1, merged_df["Satisfaction (%)"] + 10, merged_df["Satisfaction (%)"])
+        # Client and stock KPIs, once per dispatch and set of edits
+        with prof.span("summary", rows=len(merged_df)):
+            summary = dispatch_view.summary(
+                version, edits, merged_df, client_keys=("Client", "VIP"), vip_bonus=10, stock_label="Unallocated_Stock",
+                _satisfaction_given=requested
+            )
+        merged_df["Satisfaction (%)"] = summary.satisfaction
 
         st.subheader("📋 Dispatch Summary")
         st.dataframe(merged_df)
 
         # 📊 Client Satisfaction
         st.subheader("📊 Client Satisfaction Overview")
-        bar_data = merged_df.groupby(["Client", "VIP"])["Satisfaction (%)"].mean().reset_index()
+        bar_data = summary.clients
 
-        fig, ax = plt.subplots(figsize=(12, 6))
-        sns.barplot(data=bar_data, x="Client", y="Satisfaction (%)", hue="VIP", ax=ax)
-        ax.set_title("Client Satisfaction by VIP Status")
-        ax.set_ylim(0, 110)
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        with prof.span("satisfaction chart", rows=len(bar_data)):
+            # Plotting libraries are only loaded once there is something to plot
+            import seaborn as sns
+
+            fig = dispatch_report.figure(figsize=(12, 6))
+            ax = fig.subplots()
+            sns.barplot(data=bar_data, x="Client", y="Satisfaction (%)", hue="VIP", ax=ax)
+            ax.set_title("Client Satisfaction by VIP Status")
+            ax.set_ylim(0, 110)
+            ax.tick_params(axis="x", labelrotation=45)
+            st.pyplot(fig)
 
         # 🥧 Fulfillment Pie
         st.subheader("🥧 Overall Fulfillment")
-        total_ordered = merged_df["Ordered_Qty"].sum()
-        total_given = merged_df["To_Give"].sum()
-
-        fig2, ax2 = plt.subplots()
-        ax2.pie(
-            [total_given, total_ordered - total_given],
-            labels=["Fulfilled", "Unfulfilled"],
-            autopct='%1.1f%%',
-            startangle=90,
-            colors=["#2ecc71", "#e74c3c"],
-            wedgeprops={"edgecolor": "white"}
-        )
-        ax2.axis("equal")
-        ax2.set_title("Fulfillment Status")
-        st.pyplot(fig2)
+        with prof.span("fulfillment chart"):
+            fig2 = dispatch_report.figure()
+            ax2 = fig2.subplots()
+            ax2.pie(
+                summary.fulfillment,
+                labels=["Fulfilled", "Unfulfilled"],
+                autopct='%1.1f%%',
+                startangle=90,
+                colors=["#2ecc71", "#e74c3c"],
+                wedgeprops={"edgecolor": "white"}
+            )
+            ax2.axis("equal")
+            ax2.set_title("Fulfillment Status")
+            st.pyplot(fig2)
 
         # 📦 Stock Audit
         st.subheader("🧮 Stock vs Demand Audit")
-        audit_df = merged_df.groupby("Product").agg({
-            "Ordered_Qty": "sum",
-            "To_Give": "sum",
-            "Available_Qty": "first"
-        }).reset_index()
-        audit_df["Unallocated_Stock"] = audit_df["Available_Qty"] - audit_df["To_Give"]
-        audit_df["Unmet_Demand"] = audit_df["Ordered_Qty"] - audit_df["To_Give"]
-        st.dataframe(audit_df)
+        st.dataframe(summary.products)
 
         # 📥 Download Button
         st.subheader("📥 Download Report")
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            merged_df.to_excel(writer, index=False, sheet_name="Dispatch")
+        with prof.span("excel export", rows=len(merged_df)):
+            report = dispatch_report.to_excel(merged_df)
         st.download_button(
             "Download Dispatch Report",
-            data=buffer.getvalue(),
+            data=report,
             file_name="dispatch_report.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -196,3 +175,5 @@ if orders_file and stock_file:
         st.error(f"❌ Error loading files: {e}")
 else:
     st.warning("📂 Please upload both Orders and Stock files to continue.")
+
+perf.render_panel(prof, "order_dispatch")
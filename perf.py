@@ -0,0 +1,155 @@
+"""Lightweight timing instrumentation shared by the Streamlit tools.
+
+Each script run gets a ``Profiler``; stages are wrapped in ``profiler.span()``
+(or decorated with ``profiler.timed()``) and the collected spans are shown in
+an optional "Performance" expander with a JSON export for monitoring.
+When the panel is off, spans cost a couple of attribute lookups.
+
+Memory tracing is process-wide: ``tracemalloc`` runs only while at least one
+run that asked for it is inside a span (a reference count, so one session
+stopping cannot blank another's peaks), and costs nothing otherwise. Each span
+keeps its own peak, folding in the peaks of its nested spans; peaks are of the
+whole process, so runs profiled at the same time show each other's memory.
+"""
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import streamlit as st
+
+_memory_lock = threading.Lock()
+_memory_users = 0
+_memory_started = False
+
+
+def _acquire_memory():
+    """One more run wants memory peaks: start ``tracemalloc`` for the first one."""
+    global _memory_users, _memory_started
+    with _memory_lock:
+        if not _memory_users and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _memory_started = True
+        _memory_users += 1
+
+
+def _release_memory():
+    """Stop ``tracemalloc`` once no run needs it (unless it was started elsewhere)."""
+    global _memory_users, _memory_started
+    with _memory_lock:
+        _memory_users -= 1
+        if not _memory_users and _memory_started:
+            tracemalloc.stop()
+            _memory_started = False
+
+
+class Profiler:
+    def __init__(self, enabled=False, track_memory=False):
+        self.enabled = enabled
+        self.track_memory = enabled and track_memory
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.spans = []
+        self._depth = 0
+        self._started = 0
+        # Running peak of each open span, innermost last
+        self._peaks = []
+
+    def _fold_peak(self):
+        """Fold the peak since the last reset into the innermost open span, then reset it."""
+        current, peak = tracemalloc.get_traced_memory()
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @contextmanager
+    def span(self, name, rows=None):
+        """Time a stage; set ``record["rows"]`` inside the block if the count is known later."""
+        record = {"stage": name, "rows": rows}
+        if not self.enabled:
+            yield record
+            return
+
+        if self.track_memory:
+            # Tracing is held for the outermost span of the run
+            if not self._peaks:
+                _acquire_memory()
+            self._peaks.append(self._fold_peak())
+        record["depth"] = self._depth
+        record["seq"] = self._started
+        self._started += 1
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            if self.track_memory:
+                self._fold_peak()
+                peak = self._peaks.pop()
+                record["peak_mb"] = round(peak / 2**20, 2)
+                # The enclosing span's peak includes this one's
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                else:
+                    _release_memory()
+            self._depth -= 1
+            self.spans.append(record)
+
+    def timed(self, name=None):
+        """Decorator form of ``span``."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_dict(self, app=""):
+        return {"app": app, "started_at": self.started_at, "spans": self.spans}
+
+    def to_json(self, app=""):
+        return json.dumps(self.to_dict(app), indent=2, default=str)
+
+
+def start_run(app):
+    """Sidebar toggle + a fresh ``Profiler`` for this script run."""
+    with st.sidebar.expander("⏱️ Performance"):
+        enabled = st.checkbox("Record stage timings", key=f"perf_enabled_{app}")
+        track_memory = st.checkbox(
+            "Track peak memory (slower)", key=f"perf_memory_{app}", disabled=not enabled
+        )
+    return Profiler(enabled=enabled, track_memory=track_memory)
+
+
+def render_panel(profiler, app):
+    if not profiler.enabled:
+        return
+    with st.expander("⏱️ Performance", expanded=False):
+        if not profiler.spans:
+            st.caption("No stages recorded in this run.")
+            return
+        spans = sorted(profiler.spans, key=lambda record: record["seq"])
+        rows = [
+            {
+                "Stage": "  " * record.get("depth", 0) + record["stage"],
+                "Seconds": record.get("seconds"),
+                "Rows": record.get("rows"),
+                "Peak memory, process-wide (MB)": record.get("peak_mb"),
+            }
+            for record in spans
+        ]
+        st.dataframe(rows, use_container_width=True)
+        if any("peak_mb" in record for record in spans):
+            st.caption("Memory peaks are of the whole server process: other sessions running at the same time count too.")
+        st.download_button(
+            "📥 Download timings (JSON)",
+            data=profiler.to_json(app),
+            file_name=f"{app}_timings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            key=f"perf_download_{app}"
+        )
@@ -0,0 +1,86 @@
+"""Normalized reference matching backed by a trigram inverted index.
+
+Supplier references rarely match the catalogue byte for byte ("AB-1234" vs
+"ab1234"), so both sides are normalized (lower-case, alphanumerics only) and
+compared through their character trigrams. The index maps every trigram to
+the catalogue rows containing it, so looking up a term only touches rows that
+share at least one trigram with it instead of scanning the whole database.
+"""
+import math
+import re
+from collections import defaultdict
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_ref(value):
+    """Lower-case a reference and strip dashes, spaces and punctuation."""
+    if value is None:
+        return ""
+    return _NON_ALNUM.sub("", str(value).lower())
+
+
+def trigrams(text):
+    """Return the set of character trigrams of an already normalized string."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Inverted trigram index over one or more text columns of a table.
+
+    ``rows`` is an iterable of tuples, one tuple of cell values per database
+    row (typically ``df[columns].itertuples(index=False)``). Row positions in
+    search results refer to the order of that iterable.
+    """
+
+    def __init__(self, rows):
+        self.values = []
+        self.postings = defaultdict(list)
+        for pos, cells in enumerate(rows):
+            normalized = tuple(v for v in (normalize_ref(c) for c in cells) if v)
+            self.values.append(normalized)
+            grams = set()
+            for value in normalized:
+                grams |= trigrams(value)
+            for gram in grams:
+                self.postings[gram].append(pos)
+
+    def __len__(self):
+        return len(self.values)
+
+    def _contains(self, pos, term):
+        return any(term in value for value in self.values[pos])
+
+    def search(self, term, threshold=0.8, limit=None):
+        """Return ``[(row_position, score), ...]`` for rows similar to ``term``.
+
+        The score is the share of the term's trigrams found in the row, bumped
+        to 1.0 when the normalized term is a plain substring of a cell. Results
+        are sorted by descending score, then by row position.
+        """
+        term = normalize_ref(term)
+        if not term:
+            return []
+
+        grams = trigrams(term)
+        if not grams:
+            # Terms shorter than a trigram can only be matched by containment
+            hits = [(pos, 1.0) for pos in range(len(self.values)) if self._contains(pos, term)]
+            return hits[:limit] if limit else hits
+
+        counts = defaultdict(int)
+        for gram in grams:
+            for pos in self.postings.get(gram, ()):
+                counts[pos] += 1
+
+        needed = max(1, math.ceil(threshold * len(grams) - 1e-9))
+        hits = []
+        for pos, shared in counts.items():
+            if shared < needed:
+                continue
+            score = 1.0 if self._contains(pos, term) else shared / len(grams)
+            if score >= threshold:
+                hits.append((pos, round(score, 4)))
+
+        hits.sort(key=lambda hit: (-hit[1], hit[0]))
+        return hits[:limit] if limit else hits
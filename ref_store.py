@@ -0,0 +1,169 @@
+"""On-disk reference catalogue for the Excel Matcher.
+
+The catalogue workbook is ingested once into a local SQLite file so later
+matching sessions can reuse it without re-uploading and re-parsing Excel.
+Every row is stored with a content hash: refreshing from a new catalogue only
+inserts rows whose hash is new and deletes rows that disappeared, so unchanged
+rows are never re-indexed. When the SQLite build ships FTS5 with the trigram
+tokenizer, rows are also indexed for substring lookups. One store (and its
+connection) is shared by the session threads: every query holds its lock.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+import pandas as pd
+
+DATA_DIR = os.environ.get("MATCHER_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+DEFAULT_PATH = os.path.join(DATA_DIR, "reference.sqlite")
+
+
+def _row_hash(values):
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class RefStore:
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS catalogue (
+                row_key INTEGER PRIMARY KEY,
+                row_hash TEXT NOT NULL UNIQUE,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+        """)
+        self.has_fts = self._ensure_fts()
+
+    def _ensure_fts(self):
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS catalogue_fts "
+                "USING fts5(search_text, tokenize='trigram')"
+            )
+            return True
+        except sqlite3.OperationalError:
+            # Older SQLite builds: fall back to scanning the loaded frame
+            return False
+
+    def _meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def columns(self):
+        return self._meta("columns", [])
+
+    @property
+    def source_name(self):
+        return self._meta("source_name", "")
+
+    @property
+    def version(self):
+        """Increases on every refresh that changed the catalogue, or only its row order."""
+        return self._meta("version", 0)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM catalogue").fetchone()[0]
+
+    def refresh(self, df, source_name=""):
+        """Sync the store with ``df``; return counts of added/removed/unchanged rows."""
+        df = df.astype(str).fillna('')
+        columns = [str(c) for c in df.columns]
+
+        with self.lock, self.conn:
+            columns_changed = columns != self.columns
+            if columns_changed:
+                self.conn.execute("DELETE FROM catalogue")
+                if self.has_fts:
+                    self.conn.execute("DELETE FROM catalogue_fts")
+
+            existing = {
+                row_hash: (row_key, position)
+                for row_hash, row_key, position in self.conn.execute("SELECT row_hash, row_key, position FROM catalogue")
+            }
+            seen = Counter()
+            incoming = []
+            for position, values in enumerate(df.itertuples(index=False, name=None)):
+                values = list(values)
+                digest = _row_hash(values)
+                # Identical rows are kept apart by their occurrence number
+                seen[digest] += 1
+                key_hash = digest if seen[digest] == 1 else f"{digest}:{seen[digest]}"
+                incoming.append((key_hash, position, values))
+
+            incoming_hashes = {key_hash for key_hash, _, _ in incoming}
+            removed = [row_key for row_hash, (row_key, _) in existing.items() if row_hash not in incoming_hashes]
+            self.conn.executemany("DELETE FROM catalogue WHERE row_key = ?", [(k,) for k in removed])
+            if self.has_fts:
+                self.conn.executemany("DELETE FROM catalogue_fts WHERE rowid = ?", [(k,) for k in removed])
+
+            added = 0
+            kept = []
+            for key_hash, position, values in incoming:
+                if key_hash in existing:
+                    kept.append((position, *existing[key_hash]))
+                    continue
+                cur = self.conn.execute(
+                    "INSERT INTO catalogue (row_hash, position, data) VALUES (?, ?, ?)",
+                    (key_hash, position, json.dumps(values, ensure_ascii=False))
+                )
+                if self.has_fts:
+                    self.conn.execute(
+                        "INSERT INTO catalogue_fts (rowid, search_text) VALUES (?, ?)",
+                        (cur.lastrowid, "\n".join(values))
+                    )
+                added += 1
+            # Keep the upload order without touching the search index
+            moved = [(position, row_key) for position, row_key, old_position in kept if position != old_position]
+            self.conn.executemany("UPDATE catalogue SET position = ? WHERE row_key = ?", moved)
+
+            self._set_meta("columns", columns)
+            self._set_meta("source_name", source_name)
+            if added or removed or moved or columns_changed:
+                self._set_meta("version", self.version + 1)
+
+        return {"added": added, "removed": len(removed), "unchanged": len(kept)}
+
+    def load_frame(self):
+        """Return the stored catalogue as a string DataFrame in upload order.
+
+        The frame index is the store's row key, which ``candidates`` returns.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT row_key, data FROM catalogue ORDER BY position").fetchall()
+        return pd.DataFrame(
+            [json.loads(data) for _, data in rows],
+            columns=self.columns,
+            index=pd.Index([row_key for row_key, _ in rows], name="row_key"),
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def candidates(self, term):
+        """Row keys whose text may contain ``term`` (case-insensitive).
+
+        Returns ``None`` when the index cannot answer (no FTS5, or a term shorter
+        than a trigram) and the caller must scan every row instead.
+        """
+        if not self.has_fts or len(term) < 3:
+            return None
+        phrase = '"' + term.replace('"', '""') + '"'
+        with self.lock:
+            return {row[0] for row in self.conn.execute(
+                "SELECT rowid FROM catalogue_fts WHERE catalogue_fts MATCH ?", (phrase,)
+            )}
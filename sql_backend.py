@@ -0,0 +1,128 @@
+"""Optional DuckDB engine for the merge, match and pivot tabs (merger.py).
+
+Uploaded frames are registered as tables of an in-process DuckDB database and
+the heavy join / pivot / aggregate steps run as SQL, which DuckDB executes
+vectorized across all cores. Results come back as pages of DataFrames so the
+caller can preview and export them without holding one more full copy.
+DuckDB is not required: ``available()`` tells the UI whether to offer it, and
+the module is only imported once a backend is created. Use a backend as a
+context manager so its connection (and temp files) are released on errors too.
+"""
+import importlib.util
+
+ROW_COL = "__row"
+ORDER_COL = "__order"
+AGG_SQL = {
+    "sum": "sum({c})",
+    "mean": "avg({c})",
+    "count": "count({c})",
+    "max": "max({c})",
+    "min": "min({c})",
+    "nunique": "count(DISTINCT {c})",
+    "median": "median({c})",
+    "first": "arg_min({c}, __order) FILTER (WHERE {c} IS NOT NULL)",
+    "last": "arg_max({c}, __order) FILTER (WHERE {c} IS NOT NULL)",
+    "p25": "quantile_cont({c}, 0.25)",
+    "p75": "quantile_cont({c}, 0.75)",
+    "p90": "quantile_cont({c}, 0.9)",
+    "weighted mean": "sum({c} * {w}) / sum(CASE WHEN {c} IS NOT NULL THEN {w} END)",
+}
+
+
+def available():
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class DuckDBBackend:
+    def __init__(self, threads=None):
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("DuckDB is not installed (pip install duckdb).") from None
+        self.con = duckdb.connect()
+        if threads:
+            self.con.execute(f"SET threads TO {int(threads)}")
+
+    def register(self, name, df):
+        """Expose ``df`` as table ``name`` with its row order in ``__row``."""
+        self.con.register(name, df.assign(**{ROW_COL: range(len(df))}))
+        return name
+
+    def pages(self, sql, params=None, rows_per_page=100_000):
+        """Run ``sql`` and yield the result as DataFrames of about ``rows_per_page`` rows."""
+        result = self.con.execute(sql, params or [])
+        vectors = max(rows_per_page // 2048, 1)
+        while True:
+            page = result.fetch_df_chunk(vectors)
+            if page.empty:
+                break
+            yield page
+
+    def fetch(self, sql, params=None):
+        return self.con.execute(sql, params or []).fetchdf()
+
+    def union_sql(self, tables, order_column=False):
+        """UNION ALL BY NAME of ``tables`` keeping table order, then row order.
+
+        With ``order_column`` the global row order is exposed as ``__order``
+        (used by first/last aggregations) instead of sorting the result.
+        """
+        parts = " UNION ALL BY NAME ".join(
+            f"SELECT *, {n} AS __part FROM {quote(table)}" for n, table in enumerate(tables)
+        )
+        if order_column:
+            return f"SELECT * EXCLUDE (__part, {ROW_COL}), (__part::BIGINT << 40) + {ROW_COL} AS {ORDER_COL} FROM ({parts})"
+        return f"SELECT * EXCLUDE (__part, {ROW_COL}) FROM ({parts}) ORDER BY __part, {ROW_COL}"
+
+    def source_codes(self, table, source_col):
+        sql = f"SELECT DISTINCT {quote(source_col)} FROM {quote(table)} WHERE {quote(source_col)} IS NOT NULL ORDER BY 1"
+        return [row[0] for row in self.con.execute(sql).fetchall()]
+
+    def reference_matrix_sql(self, left, left_ref, right, right_ref, source_col, qty_col, codes):
+        """Left table joined with one column per source code (first quantity per pair)."""
+        cells = ",\n".join(
+            f"arg_min({quote(qty_col)}, {ROW_COL}) FILTER (WHERE {quote(source_col)} = ?) AS {quote(label)}"
+            for label in codes.values()
+        )
+        params = list(codes)
+        return (
+            f"WITH matrix AS (SELECT {quote(right_ref)} AS __ref, {cells} "
+            f"FROM {quote(right)} GROUP BY 1) "
+            f"SELECT l.* EXCLUDE ({ROW_COL}{''.join(', ' + quote(c) for c in codes.values() if c in self.columns(left))}), "
+            f"{', '.join('m.' + quote(label) for label in codes.values())} "
+            f"FROM {quote(left)} l LEFT JOIN matrix m ON l.{quote(left_ref)} = m.__ref "
+            f"ORDER BY l.{ROW_COL}"
+        ), params
+
+    def group_aggregate_sql(self, source_sql, group_cols, tasks, names, weight_col=None):
+        """GROUP BY query applying each ``(column, func)`` task, aliased by ``names``.
+
+        ``source_sql`` must come from ``union_sql(..., order_column=True)``.
+        """
+        groups = ", ".join(quote(c) for c in group_cols)
+        w = f"TRY_CAST({quote(weight_col)} AS DOUBLE)" if weight_col is not None else "NULL"
+        aggs = ", ".join(
+            AGG_SQL[func].format(c=quote(col), w=w) + f" AS {quote(name)}"
+            for (col, func), name in zip(tasks, names)
+        )
+        not_null = " AND ".join(f"{quote(c)} IS NOT NULL" for c in group_cols)
+        return (
+            f"SELECT {groups}, {aggs} FROM ({source_sql}) WHERE {not_null} "
+            f"GROUP BY {groups} ORDER BY {groups}"
+        )
+
+    def columns(self, table):
+        return [row[0] for row in self.con.execute(f"DESCRIBE {quote(table)}").fetchall()]
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from dispatch_ledger import DispatchLedger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return DispatchLedger(str(tmp_path / "ledger.sqlite"))
+
+
+def orders(*lines):
+    return pd.DataFrame(lines, columns=["Client", "Product", "Ordered_Qty"])
+
+
+def stock(**quantities):
+    return pd.DataFrame({"Product": list(quantities), "Available_Qty": list(quantities.values())})
+
+
+def dispatch(ledger, orders_df, stock_df, day, **options):
+    """Plan ``day``, give every line what the stock allows (in book order) and commit."""
+    plan = ledger.plan(orders_df, stock_df, day=day, **options)
+    left = plan.stock.set_index("Product")["Available_Qty"].to_dict()
+    given = []
+    for product, owed in plan.book[["Product", "Ordered_Qty"]].itertuples(index=False):
+        give = min(owed, left.get(product, 0))
+        left[product] = left.get(product, 0) - give
+        given.append(give)
+    ledger.commit(plan, given)
+    return plan, given
+
+
+def test_repeated_identical_deltas_are_new_orders_and_receipts(ledger):
+    day1, given1 = dispatch(ledger, orders(["c1", "A", 5]), stock(A=5), "2025-01-01")
+    assert given1 == [5]
+    day2, given2 = dispatch(ledger, orders(["c1", "A", 5]), stock(A=5), "2025-01-02")
+    assert len(day2.book) == 1 and day2.new.all()
+    assert day2.stock["Available_Qty"].tolist() == [5]
+    assert given2 == [5]
+    assert ledger.stats()["open_lines"] == 0
+
+
+def test_same_delta_recorded_twice_the_same_day_counts_once(ledger):
+    dispatch(ledger, orders(["c1", "A", 5]), stock(A=2), "2025-01-01")
+    # The page reruns with the same files after recording
+    plan = ledger.plan(orders(["c1", "A", 5]), stock(A=2), day="2025-01-01")
+    assert not plan.new.any()
+    # No new line and no new stock: nothing can move, the 3 still owed stay open
+    assert plan.book.empty
+    assert ledger.backorders()["Backorder_Qty"].tolist() == [3]
+
+
+def test_backorders_carry_over_with_delta_files(ledger):
+    dispatch(ledger, orders(["c1", "A", 5], ["c2", "B", 4]), stock(A=2), "2025-01-01")
+    plan, given = dispatch(ledger, orders(["c3", "A", 1]), stock(A=4, B=1), "2025-01-02")
+    assert plan.book["Ordered_Qty"].tolist() == [3, 4, 1]
+    assert plan.book["Backorder_Since"].tolist() == ["2025-01-01", "2025-01-01", "2025-01-02"]
+    assert given == [3, 1, 1]
+
+
+def test_cumulative_history_only_adds_extra_copies(ledger):
+    dispatch(ledger, orders(["c1", "A", 5]), stock(A=0), "2025-01-01")
+    plan = ledger.plan(
+        orders(["c1", "A", 5], ["c1", "A", 5], ["c2", "A", 1]), stock(A=0), cumulative=True, day="2025-01-02"
+    )
+    assert plan.new.tolist() == [False, True, True]
+    assert len(set(plan.keys)) == len(plan.keys)
+
+
+def test_ledgers_without_content_hashes_are_upgraded(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE lines (line_hash TEXT PRIMARY KEY, product TEXT NOT NULL, ordered REAL NOT NULL, "
+            "delivered REAL NOT NULL DEFAULT 0, since TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        conn.execute("INSERT INTO lines VALUES ('00ff:0', 'A', 5, 0, '2025-01-01', '{}')")
+    with sqlite3.connect(DispatchLedger(path).path) as conn:
+        assert conn.execute("SELECT content_hash FROM lines").fetchone() == ("00ff",)
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+import dispatch_core
+
+
+def test_order_dates_reads_iso_and_day_first_text():
+    values = pd.Series(["2025-01-13", "02/01/2025", "2025-01-02", "13/01/2025", None, "later"], dtype=object)
+    dates = dispatch_core._order_dates(values)
+    assert dates.tolist()[:4] == [pd.Timestamp(d) for d in ("2025-01-13", "2025-01-02", "2025-01-02", "2025-01-13")]
+    assert dates[4:].isna().all()
+
+
+def test_fifo_serves_oldest_mixed_format_dates_first():
+    orders = pd.DataFrame({
+        "Product": ["A"] * 4,
+        "Ordered_Qty": [5, 5, 5, 5],
+        "Date": ["2025-01-13", "12/01/2025", "2025-01-02", "not a date"],
+    })
+    stock = pd.DataFrame({"Product": ["A"], "Available_Qty": [12]})
+    dispatch_core.fifo(orders, stock, date_column="Date")
+    # 2 Jan, then 12 Jan, then 13 Jan; undated lines last
+    assert orders["Auto_Dispatch_Qty"].tolist() == [2, 5, 5, 0]
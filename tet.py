@@ -1,19 +1,77 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from io import BytesIO
+import dataset_registry
+import jobs
+import perf
+from matching import MatchPipeline
+from ref_index import TrigramIndex
+from ref_store import RefStore
 
 st.set_page_config(page_title="Excel Matcher", layout="wide")
 
+
+@st.cache_resource(show_spinner="Building reference index...")
+def build_trigram_index(database_df, database_columns):
+    return TrigramIndex(database_df[database_columns].itertuples(index=False))
+
+
+@st.cache_resource
+def get_ref_store():
+    return RefStore()
+
+
+def match_job(job, database_df, database_columns, output_columns, search_terms, filename, store_path=None, **options):
+    """``store_path``: the saved reference database to look candidates up in, opened for this job only."""
+    job.progress(0, "Preparing")
+    store = RefStore(store_path) if store_path else None
+    try:
+        pipeline = MatchPipeline(
+            database_df, database_columns, output_columns, search_terms,
+            candidates=store.candidates if store else None, **options
+        )
+        workbook = pipeline.run(job.progress)
+    finally:
+        if store:
+            store.close()
+    return filename, workbook
+
+
+@st.cache_data(show_spinner="Loading saved reference database...")
+def load_saved_database(version):
+    return get_ref_store().load_frame()
+
+
 st.title("🔍 Excel Matcher App")
+prof = perf.start_run("matcher")
+
+store = get_ref_store()
+
+# Saved reference database
+with st.sidebar:
+    st.header("💾 Reference Database")
+    if len(store):
+        st.caption(f"{len(store)} rows saved from `{store.source_name}` (version {store.version}).")
+    else:
+        st.caption("No catalogue saved yet.")
+    catalogue_file = st.file_uploader("Upload a catalogue to save or refresh", type=["xlsx"], key="catalogue")
+    if catalogue_file and st.button("💾 Save / Refresh"):
+        with st.spinner("Indexing catalogue..."):
+            with prof.span("refresh reference database") as span:
+                stats = store.refresh(dataset_registry.read_excel(catalogue_file), source_name=catalogue_file.name)
+                span["rows"] = stats["added"] + stats["unchanged"]
+        st.success(f"✅ {stats['added']} rows added, {stats['removed']} removed, {stats['unchanged']} unchanged.")
 
 # Upload files
-database_file = st.file_uploader("Upload the database Excel file", type=["xlsx"])
-search_terms_file = st.file_uploader("Upload the search terms Excel file", type=["xlsx"])
+use_saved_database = bool(len(store)) and st.checkbox("Use the saved reference database", value=True)
+with prof.span("read uploads"):
+    database_df = None if use_saved_database else dataset_registry.pick("Upload the database Excel file", key="database")
+    search_terms_df = dataset_registry.pick("Upload the search terms Excel file", key="search_terms")
 
-if database_file and search_terms_file:
-    database_df = pd.read_excel(database_file)
-    search_terms_df = pd.read_excel(search_terms_file)
+if (use_saved_database or database_df is not None) and search_terms_df is not None:
+    if use_saved_database:
+        with prof.span("read database") as span:
+            database_df = load_saved_database(store.version)
+            span["rows"] = len(database_df)
 
     st.success("Files uploaded successfully.")
 
@@ -21,92 +79,97 @@ if database_file and search_terms_file:
     database_columns = st.multiselect("Select columns to search in", database_df.columns.tolist())
     output_columns = st.multiselect("Select columns to include in the output", database_df.columns.tolist())
 
+    match_mode = st.radio(
+        "Matching mode",
+        ["Exact substring", "Normalized / fuzzy"],
+        horizontal=True,
+        help="Normalized mode ignores case, dashes and spaces (AB-1234 = ab1234) and ranks candidates by similarity."
+    )
+    fuzzy_mode = match_mode == "Normalized / fuzzy"
+    if fuzzy_mode:
+        fuzzy_threshold = st.slider("Minimum similarity score", 0.3, 1.0, 0.8, 0.05)
+    repeat_duplicates = st.checkbox(
+        "Repeat results for duplicated search rows",
+        value=True,
+        help="Duplicated rows of the search file are matched once; untick to list their results only once."
+    )
+
+    with st.expander("⚙️ Result limits"):
+        max_results = st.number_input("Maximum number of matches (0 = no limit)", min_value=0, value=0, step=100000)
+        per_term_limit = st.number_input("Maximum matches per search row (0 = no limit)", min_value=0, value=0, step=10)
+        spill_to_disk = st.checkbox(
+            "Spill matches to disk",
+            value=False,
+            help="Keeps matched positions in temporary files instead of memory; useful for very broad search terms."
+        )
+
+    run_in_background = st.checkbox(
+        "Run in the background",
+        value=False,
+        help="The match keeps running if the page is refreshed; the workbook appears under Background jobs."
+    )
+
     if st.button("Start Matching") and search_terms_columns and database_columns and output_columns:
         search_terms = {
             col: search_terms_df[col].fillna('').astype(str).tolist()
             for col in search_terms_columns
         }
-
-        unique_search_terms = {
-            col: list(dict.fromkeys(terms)) for col, terms in search_terms.items()
-        }
-
         database_df = database_df.astype(str).fillna('')
-        matched_results = []
-
-        total_iterations = len(database_df) * sum(len(terms) for terms in search_terms.values())
-        progress_bar = st.progress(0)
-        progress_counter = 0
-
-        for index, row in database_df.iterrows():
-            for term_sets in zip(*search_terms.values()):
-                if any(term in row[col] for col in database_columns for term in term_sets if term):
-                    match_dict = {f'searched_ref_{i+1}': term for i, term in enumerate(term_sets)}
-                    match_dict.update({col: row[col] for col in output_columns})
-                    matched_results.append(match_dict)
-                progress_counter += 1
-                progress_bar.progress(min(progress_counter / total_iterations, 1.0))
-
-        matched_df = pd.DataFrame(matched_results)
-
-        for i, col in enumerate(search_terms_columns):
-            matched_df[f'searched_ref_{i+1}'] = pd.Categorical(
-                matched_df[f'searched_ref_{i+1}'],
-                categories=unique_search_terms[col],
-                ordered=True
-            )
-
-        sort_columns = [f'searched_ref_{i+1}' for i in range(len(search_terms_columns))]
-        matched_df.sort_values(by=sort_columns, inplace=True)
-
-        st.subheader("🎯 Matching Results")
-        st.dataframe(matched_df.head(100))
-
-        output = BytesIO()
-        writer = pd.ExcelWriter(output, engine='xlsxwriter')
-
-        def write_chunks(writer, df, sheet_name_base, max_rows=1048576):
-            num_chunks = (len(df) // max_rows) + 1
-            for i in range(num_chunks):
-                start_row = i * max_rows
-                end_row = (i + 1) * max_rows
-                chunk_df = df.iloc[start_row:end_row]
-                sheet_name = f"{sheet_name_base}_{i + 1}"
-                chunk_df.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1, header=False)
-
-                workbook = writer.book
-                worksheet = writer.sheets[sheet_name]
-
-                header = sort_columns + output_columns
-                for col_num, value in enumerate(header):
-                    worksheet.write(0, col_num, value)
-
-                searched_ref_format = workbook.add_format({'bold': True, 'font_color': 'blue'})
-                normal_format = workbook.add_format({'font_color': 'black'})
-                prev_searched_refs = [None] * len(search_terms_columns)
-
-                for row_num, row_data in enumerate(chunk_df.values, start=1):
-                    for i in range(len(search_terms_columns)):
-                        if row_data[i] != prev_searched_refs[i]:
-                            worksheet.write(row_num, i, row_data[i], searched_ref_format)
-                            prev_searched_refs[i] = row_data[i]
-                        else:
-                            worksheet.write_blank(row_num, i, None, normal_format)
-                    for col_num, value in enumerate(row_data[len(search_terms_columns):], start=len(search_terms_columns)):
-                        worksheet.write(row_num, col_num, value, normal_format)
-
-        write_chunks(writer, matched_df, "Results")
-        writer.close()
-        output.seek(0)
-
+        options = dict(
+            fuzzy_threshold=fuzzy_threshold if fuzzy_mode else None,
+            max_results=max_results, per_term_limit=per_term_limit,
+            spill=spill_to_disk, repeat_duplicates=repeat_duplicates,
+        )
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"matched_results_{timestamp}.xlsx"
-        st.download_button(
-            label="📥 Download Results",
-            data=output,
-            file_name=filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+
+        if run_in_background:
+            # The job opens its own store connection for candidate lookups
+            jobs.get_runner().submit(
+                "match", f"Match {len(search_terms[search_terms_columns[0]]):,} search rows", match_job,
+                database_df, database_columns, output_columns, search_terms, filename,
+                store_path=store.path if use_saved_database and not fuzzy_mode else None, **options
+            )
+            st.success("🕒 Matching started in the background.")
+        else:
+            with prof.span("prepare matcher") as span:
+                index = build_trigram_index(database_df, database_columns) if fuzzy_mode else None
+                pipeline = MatchPipeline(
+                    database_df, database_columns, output_columns, search_terms, index=index,
+                    candidates=store.candidates if use_saved_database else None, **options
+                )
+                span["rows"] = len(pipeline.unique_rows)
+
+            with prof.span("match") as span:
+                progress_bar = st.progress(0)
+                pipeline.match(progress=progress_bar.progress)
+                progress_bar.progress(1.0)
+                span["rows"] = len(pipeline.results)
+
+            with prof.span("sort results") as span:
+                order = pipeline.sort()
+                span["rows"] = len(order)
+
+            st.subheader("🎯 Matching Results")
+            if pipeline.results.truncated:
+                st.warning(f"⚠️ Result limit reached: only {len(order):,} matches were kept.")
+            st.caption(f"{len(order):,} matches")
+            st.dataframe(pipeline.frame(order[:100]))
+
+            with prof.span("excel export", rows=len(order)):
+                output = pipeline.write_excel()
+            pipeline.close()
+
+            st.download_button(
+                label="📥 Download Results",
+                data=output,
+                file_name=filename,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
+    jobs.render_jobs(["match"], key="matcher_jobs")
 
 else:
     st.info("Please upload both Excel files to get started.")
+
+perf.render_panel(prof, "matcher")